@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Benchmarks of the AES functions of part_a_b.py and the hash functions of part_c_d.py
+# Every case runs in its own process, so the peak memory of a case is the peak of that process
+# Run like that: python benchmark.py --sizes 16,1K,1M,256M --output bench.json --baseline old.json
+
+import part_a_b as aesmodule
+import part_c_d as hashmodule
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Default payload sizes
+defaultSizes = "16,1K,64K,1M"
+
+# Every case is repeated until it ran at least this long, the best time is kept
+minimumTime = 0.2
+
+# Read a size like 16, 64K or 256M as bytes
+def parseSize(text):
+	units = dict(K=1 << 10, M=1 << 20, G=1 << 30)
+	text = text.strip().upper()
+
+	if(text[-1] in units):
+		return int(text[:-1]) * units[text[-1]]
+
+	return int(text)
+
+# Returns the best time of `function` in seconds, over `repeat` runs of at least minimumTime
+def measure(function, repeat):
+	best = None
+
+	for i in range(repeat):
+		loops = 0
+		start = time.time()
+		while(True):
+			function()
+			loops += 1
+			elapsed = time.time() - start
+			if(elapsed >= minimumTime):
+				break
+
+		seconds = elapsed / loops
+		if(best is None or seconds < best):
+			best = seconds
+
+	return best
+
+# Returns the function of a case and the number of bytes it processes
+# The setup (keys, messages, files) is done here, so it is not measured
+def setupCase(name, size, directory):
+	key = aesmodule.generateRandomKey()
+	message = os.urandom(size)
+	aes = aesmodule.AES()
+
+	if(name == "keyExpand"):
+		keyList = list(bytearray(key))
+		return (lambda: aes.keyExpand(keyList, 176)), 16
+
+	if(name == "encryptn"):
+		block = list(bytearray(message[:16]))
+		expandedKey = aesmodule.getExpandedKey(key)
+		return (lambda: aes.encryptn(block, expandedKey)), 16
+
+	if(name == "decryptn"):
+		block = list(bytearray(message[:16]))
+		expandedKey = aesmodule.getExpandedKey(key)
+		return (lambda: aes.decryptn(block, expandedKey)), 16
+
+	if(name.startswith("encryptMessage ")):
+		mode = aesmodule.AES.modes[name.split()[1]]
+		return (lambda: aesmodule.encryptMessage(key, message, mode)), size
+
+	if(name.startswith("decryptMessage ")):
+		mode = aesmodule.AES.modes[name.split()[1]]
+		cipher = aesmodule.encryptMessage(key, message, mode)
+		return (lambda: aesmodule.decryptMessage(key, cipher, mode)), size
+
+	if(name == "hash"):
+		return (lambda: hashmodule.hash(message)), size
+
+	# The partC/partD flows work on files in the directory of the case
+	filename = "bench.txt"
+	with open(os.path.join(directory, filename), "wb") as file:
+		file.write(message)
+	os.chdir(directory)
+
+	if(name == "partC/partD"):
+		# partC and partD read the file names from the module
+		hashmodule.filename = filename
+		hashmodule.encryptFilename = "hash_encrypt_" + filename
+
+		def flow():
+			hashmodule.partC(open(filename, "r+"), key)
+			hashmodule.partD(hashmodule.encryptFilename, key)
+
+		return flow, size
+
+	if(name == "partC/partD mmap"):
+		def flow():
+			hashmodule.partDMapped(hashmodule.partCMapped(filename, key), key)
+
+		return flow, size
+
+	if(name == "partC/partD sealed"):
+		def flow():
+			hashmodule.partDSealed(hashmodule.partCSealed(filename, key), key, "opened_" + filename)
+
+		return flow, size
+
+	raise ValueError("unknown case " + name)
+
+# Runs one case in a child process and sends its result through `connection`
+def runCase(connection, name, size, repeat):
+	directory = tempfile.mkdtemp()
+	devnull = open(os.devnull, "w")
+
+	try:
+		function, processed = setupCase(name, size, directory)
+
+		# The demo functions print their results, they are not part of the measure
+		stdout = sys.stdout
+		sys.stdout = devnull
+		try:
+			seconds = measure(function, repeat)
+		finally:
+			sys.stdout = stdout
+
+		connection.send(dict(
+			name=name,
+			size=size,
+			seconds=seconds,
+			mbps=processed / seconds / (1 << 20),
+			blockLatencyUs=seconds / max(1, processed // 16) * 1e6,
+			peakMemoryKb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+	except Exception as error:
+		connection.send(dict(name=name, size=size, error=str(error)))
+	finally:
+		devnull.close()
+		shutil.rmtree(directory, True)
+		connection.close()
+
+# The cases measured for each payload size
+def caseNames(size):
+	names = []
+
+	# The block functions do not depend on the payload
+	if(size == 16):
+		names += ["keyExpand", "encryptn", "decryptn"]
+
+	for modeName in sorted(aesmodule.AES.modes, key=aesmodule.AES.modes.get):
+		names += ["encryptMessage " + modeName, "decryptMessage " + modeName]
+
+	# hash() is defined for 16 bytes and more
+	if(size >= 16):
+		names += ["hash", "partC/partD", "partC/partD mmap", "partC/partD sealed"]
+
+	return names
+
+# Runs every case and returns the results
+def runBenchmarks(sizes, repeat, names=None):
+	results = []
+
+	for size in sizes:
+		for name in caseNames(size):
+			if(names and name not in names):
+				continue
+
+			parent, child = multiprocessing.Pipe()
+			process = multiprocessing.Process(target=runCase, args=(child, name, size, repeat))
+			process.start()
+			result = parent.recv()
+			process.join()
+
+			results.append(result)
+			printResult(result)
+
+	return results
+
+def printResult(result):
+	if("error" in result):
+		print "%-26s %12d  ERROR %s" % (result["name"], result["size"], result["error"])
+		return
+
+	print "%-26s %12d  %10.3f MB/s  %12.2f us/block  %10d KB" % (result["name"], result["size"], result["mbps"],
+																	  result["blockLatencyUs"], result["peakMemoryKb"])
+
+# Compares the results with a baseline and returns the regressions
+# A case regresses when it is more than `threshold` slower than in the baseline
+def compareBaseline(results, baseline, threshold):
+	previous = dict(((result["name"], result["size"]), result) for result in baseline["results"] if "error" not in result)
+	regressions = []
+
+	for result in results:
+		old = previous.get((result["name"], result["size"]))
+		if(old is None or "error" in result):
+			continue
+
+		ratio = result["seconds"] / old["seconds"]
+		if(ratio > 1 + threshold):
+			regressions.append(dict(name=result["name"], size=result["size"], baselineSeconds=old["seconds"],
+									seconds=result["seconds"], ratio=ratio))
+
+	return regressions
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks of AES encryption and hashing")
+	parser.add_argument("--sizes", default=defaultSizes, help="payload sizes, like 16,1K,1M,256M")
+	parser.add_argument("--repeat", type=int, default=3, help="runs of each case, the best one is kept")
+	parser.add_argument("--case", action="append", help="only run this case, can be given more than once")
+	parser.add_argument("--output", help="write the results as JSON to this file")
+	parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+	parser.add_argument("--threshold", type=float, default=0.10, help="slowdown ratio reported as a regression")
+	args = parser.parse_args()
+
+	sizes = [parseSize(size) for size in args.sizes.split(",")]
+	results = runBenchmarks(sizes, args.repeat, args.case)
+	report = dict(python=sys.version.split()[0], numpy=aesmodule.numpy is not None, backend=aesmodule.backendName(), results=results)
+
+	status = 0
+	if(args.baseline):
+		with open(args.baseline) as file:
+			regressions = compareBaseline(results, json.load(file), args.threshold)
+		report["regressions"] = regressions
+
+		for regression in regressions:
+			print "REGRESSION %-26s %12d  %.2fx slower" % (regression["name"], regression["size"], regression["ratio"])
+		if(regressions):
+			status = 1
+
+	if(args.output):
+		with open(args.output, "w") as file:
+			json.dump(report, file, indent=2, sort_keys=True)
+
+	sys.exit(status)
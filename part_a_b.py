@@ -1,10 +1,51 @@
 import os
-import math
+import binascii
+import hmac
+import mmap
+import multiprocessing
+import struct
+import sys
+import threading
+import time
+import weakref
+import Queue
+from collections import OrderedDict
+
+# NumPy is optional, it is only used by the multi-block engine
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 class AES(object):
 
 	# Structure of supported modes of operation
-	modes = dict(CFB=0, CBC=1, OFB=2)
+	# GCM - CTR encryption and a GHASH tag over the cipher text, the output ends with the 16 byte tag
+	modes = dict(CFB=0, CBC=1, OFB=2, CTR=3, GCM=4)
+
+	# Number of counter blocks encrypted together in CTR mode
+	counterBatch = 4096
+
+	# Number of blocks in each chunk of the parallel CBC and CFB decryption
+	chunkBlocks = 4096
+
+	# The python backend runs batches of at least this many blocks through the BITSLICE engine, smaller ones block by block through TTABLE
+	bitsliceMinBlocks = 256
+
+	# The numpy backend runs smaller batches block by block through TTABLE, a NumPy call costs more than a few blocks
+	numpyMinBlocks = 64
+
+	# Structure of supported block engines
+	# BYTE - the byte-wise reference rounds
+	# TTABLE - 32-bit column words with precomputed Te0..Te3 tables
+	# BITSLICE - many blocks at once as bit planes in big integers, without tables and without NumPy
+	engines = dict(BYTE=0, TTABLE=1, BITSLICE=2)
+
+	# The engine used by encryptn when none is given
+	engine = engines["TTABLE"]
+
+	# The Backend used by processBlocks, the selected backend of the module when it is None
+	backend = None
 
 	# S-box
 	sbox = [0x63, 0x7c, 0x77, 0x7b, 0xf2, 0x6b, 0x6f, 0xc5, 0x30, 0x01, 0x67, 0x2b, 0xfe, 0xd7,
@@ -65,6 +106,12 @@ class AES(object):
 			0x9f, 0x25, 0x4a, 0x94, 0x33, 0x66, 0xcc, 0x83, 0x1d, 0x3a, 0x74,
 			0xe8, 0xcb]
 
+	def __init__(self, engine=None, backend=None):
+		if(engine is not None):
+			self.engine = engine
+		if(backend is not None):
+			self.backend = backend
+
 	# Retrieves a gIVectoren S-Box Value
 	def getSBox(self, num):
 		return self.sbox[num]
@@ -176,25 +223,23 @@ class AES(object):
 
 	# Multiplication of the 4x4 matrix
 	def mixColumns(self, st, isInv):
+		# Multiplication tables of the matrix coefficients
+		if(isInv == True):
+			m0, m1, m2, m3 = self.mulTables[14], self.mulTables[9], self.mulTables[13], self.mulTables[11]
+		else:
+			m0, m1, m2, m3 = self.mulTables[2], self.mulTables[1], self.mulTables[1], self.mulTables[3]
+
 		# Iterate over the 4 columns
 		for i in range(4):
 			# Construct one column by slicing over the 4 rows
-			column = st[i : i+16 : 4]
+			c0, c1, c2, c3 = st[i : i+16 : 4]
 
 			# Apply the mixColumn on one column
 			# Multiplication of 1 column of the 4x4 matrix
-			if(isInv == True):
-				mult = [14, 9, 13, 11]
-			else:
-				mult = [2, 1, 1, 3]
-
-			cpy = list(column)
-			g = self.multiple
-
-			column[0] = g(cpy[0], mult[0]) ^ g(cpy[3], mult[1]) ^ g(cpy[2], mult[2]) ^ g(cpy[1], mult[3])
-			column[1] = g(cpy[1], mult[0]) ^ g(cpy[0], mult[1]) ^ g(cpy[3], mult[2]) ^ g(cpy[2], mult[3])
-			column[2] = g(cpy[2], mult[0]) ^ g(cpy[1], mult[1]) ^ g(cpy[0], mult[2]) ^ g(cpy[3], mult[3])
-			column[3] = g(cpy[3], mult[0]) ^ g(cpy[2], mult[1]) ^ g(cpy[1], mult[2]) ^ g(cpy[0], mult[3])
+			column = [m0[c0] ^ m1[c3] ^ m2[c2] ^ m3[c1],
+					  m0[c1] ^ m1[c0] ^ m2[c3] ^ m3[c2],
+					  m0[c2] ^ m1[c1] ^ m2[c0] ^ m3[c3],
+					  m0[c3] ^ m1[c2] ^ m2[c1] ^ m3[c0]]
 
 			# Put the values back into the st
 			st[i : i+16 : 4] = column
@@ -237,60 +282,145 @@ class AES(object):
 
 		return st
 
-	# Perform the initial operations, the standard round, and the final operations of the forward aes, creating a round key for each round
-	def AES(self, st, expandedKey, nbrRounds):
-		st = self.roundKey(st, self.createRoundKey(expandedKey, 0))
+	# Perform the initial operations, the standard round, and the final operations of the forward aes, using the precomputed round key of each round
+	def AES(self, st, roundKeys, nbrRounds):
+		st = self.roundKey(st, roundKeys[0])
 		i = 1
 
 		while(i < nbrRounds):
-			st = self.AESround(st, self.createRoundKey(expandedKey, 16*i))
+			st = self.AESround(st, roundKeys[i])
 			i += 1
 
 		st = self.bytesSubst(st, False)
 		st = self.shiftRows(st, False)
-		st = self.roundKey(st, self.createRoundKey(expandedKey, 16*nbrRounds))
+		st = self.roundKey(st, roundKeys[nbrRounds])
 
 		return st
 
-	# Perform the initial operations, the standard round, and the final operations of the inverse aes, creating a round key for each round
-	def AES_Inv(self, st, expandedKey, nbrRounds):
-		st = self.roundKey(st, self.createRoundKey(expandedKey, 16*nbrRounds))
+	# Perform the initial operations, the standard round, and the final operations of the inverse aes, using the precomputed round key of each round
+	def AES_Inv(self, st, roundKeys, nbrRounds):
+		st = self.roundKey(st, roundKeys[nbrRounds])
 		i = nbrRounds - 1
 
 		while(i > 0):
-			st = self.AESInvround(st, self.createRoundKey(expandedKey, 16*i))
+			st = self.AESInvround(st, roundKeys[i])
 			i -= 1
 
 		st = self.shiftRows(st, True)
 		st = self.bytesSubst(st, True)
-		st = self.roundKey(st, self.createRoundKey(expandedKey, 0))
+		st = self.roundKey(st, roundKeys[0])
 
 		return st
 
+	# Forward aes on four 32-bit column words. SubBytes, ShiftRows and MixColumns of a round are merged into the Te0..Te3 lookups
+	# input - the 16 byte block, column by column
+	# words - the round keys as 32-bit words
+	def AESTable(self, input, words, nbrRounds):
+		Te0 = self.Te0
+		Te1 = self.Te1
+		Te2 = self.Te2
+		Te3 = self.Te3
+		sbox = self.sbox
+
+		# Load the columns and add the first round key
+		s0 = (input[0] << 24 | input[1] << 16 | input[2] << 8 | input[3]) ^ words[0]
+		s1 = (input[4] << 24 | input[5] << 16 | input[6] << 8 | input[7]) ^ words[1]
+		s2 = (input[8] << 24 | input[9] << 16 | input[10] << 8 | input[11]) ^ words[2]
+		s3 = (input[12] << 24 | input[13] << 16 | input[14] << 8 | input[15]) ^ words[3]
+
+		k = 4
+		for i in range(nbrRounds - 1):
+			t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xFF] ^ Te2[(s2 >> 8) & 0xFF] ^ Te3[s3 & 0xFF] ^ words[k]
+			t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xFF] ^ Te2[(s3 >> 8) & 0xFF] ^ Te3[s0 & 0xFF] ^ words[k+1]
+			t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xFF] ^ Te2[(s0 >> 8) & 0xFF] ^ Te3[s1 & 0xFF] ^ words[k+2]
+			t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xFF] ^ Te2[(s1 >> 8) & 0xFF] ^ Te3[s2 & 0xFF] ^ words[k+3]
+			s0 = t0
+			s1 = t1
+			s2 = t2
+			s3 = t3
+			k += 4
+
+		# The final round has no MixColumns, only SubBytes and ShiftRows
+		t0 = (sbox[s0 >> 24] << 24 | sbox[(s1 >> 16) & 0xFF] << 16 | sbox[(s2 >> 8) & 0xFF] << 8 | sbox[s3 & 0xFF]) ^ words[k]
+		t1 = (sbox[s1 >> 24] << 24 | sbox[(s2 >> 16) & 0xFF] << 16 | sbox[(s3 >> 8) & 0xFF] << 8 | sbox[s0 & 0xFF]) ^ words[k+1]
+		t2 = (sbox[s2 >> 24] << 24 | sbox[(s3 >> 16) & 0xFF] << 16 | sbox[(s0 >> 8) & 0xFF] << 8 | sbox[s1 & 0xFF]) ^ words[k+2]
+		t3 = (sbox[s3 >> 24] << 24 | sbox[(s0 >> 16) & 0xFF] << 16 | sbox[(s1 >> 8) & 0xFF] << 8 | sbox[s2 & 0xFF]) ^ words[k+3]
+
+		return [t0 >> 24, (t0 >> 16) & 0xFF, (t0 >> 8) & 0xFF, t0 & 0xFF,
+				t1 >> 24, (t1 >> 16) & 0xFF, (t1 >> 8) & 0xFF, t1 & 0xFF,
+				t2 >> 24, (t2 >> 16) & 0xFF, (t2 >> 8) & 0xFF, t2 & 0xFF,
+				t3 >> 24, (t3 >> 16) & 0xFF, (t3 >> 8) & 0xFF, t3 & 0xFF]
+
+	# Equivalent inverse cipher (FIPS-197 5.3.5) on four 32-bit column words. InvMixColumns is already applied to the round keys, so each round is Td0..Td3 lookups
+	# input - the 16 byte block, column by column
+	# words - the decryption round keys as 32-bit words, in the order they are used
+	def AESInvTable(self, input, words, nbrRounds):
+		Td0 = self.Td0
+		Td1 = self.Td1
+		Td2 = self.Td2
+		Td3 = self.Td3
+		inv_sbox = self.inv_sbox
+
+		# Load the columns and add the last round key
+		s0 = (input[0] << 24 | input[1] << 16 | input[2] << 8 | input[3]) ^ words[0]
+		s1 = (input[4] << 24 | input[5] << 16 | input[6] << 8 | input[7]) ^ words[1]
+		s2 = (input[8] << 24 | input[9] << 16 | input[10] << 8 | input[11]) ^ words[2]
+		s3 = (input[12] << 24 | input[13] << 16 | input[14] << 8 | input[15]) ^ words[3]
+
+		k = 4
+		for i in range(nbrRounds - 1):
+			t0 = Td0[s0 >> 24] ^ Td1[(s3 >> 16) & 0xFF] ^ Td2[(s2 >> 8) & 0xFF] ^ Td3[s1 & 0xFF] ^ words[k]
+			t1 = Td0[s1 >> 24] ^ Td1[(s0 >> 16) & 0xFF] ^ Td2[(s3 >> 8) & 0xFF] ^ Td3[s2 & 0xFF] ^ words[k+1]
+			t2 = Td0[s2 >> 24] ^ Td1[(s1 >> 16) & 0xFF] ^ Td2[(s0 >> 8) & 0xFF] ^ Td3[s3 & 0xFF] ^ words[k+2]
+			t3 = Td0[s3 >> 24] ^ Td1[(s2 >> 16) & 0xFF] ^ Td2[(s1 >> 8) & 0xFF] ^ Td3[s0 & 0xFF] ^ words[k+3]
+			s0 = t0
+			s1 = t1
+			s2 = t2
+			s3 = t3
+			k += 4
+
+		# The final round has no InvMixColumns, only InvSubBytes and InvShiftRows
+		t0 = (inv_sbox[s0 >> 24] << 24 | inv_sbox[(s3 >> 16) & 0xFF] << 16 | inv_sbox[(s2 >> 8) & 0xFF] << 8 | inv_sbox[s1 & 0xFF]) ^ words[k]
+		t1 = (inv_sbox[s1 >> 24] << 24 | inv_sbox[(s0 >> 16) & 0xFF] << 16 | inv_sbox[(s3 >> 8) & 0xFF] << 8 | inv_sbox[s2 & 0xFF]) ^ words[k+1]
+		t2 = (inv_sbox[s2 >> 24] << 24 | inv_sbox[(s1 >> 16) & 0xFF] << 16 | inv_sbox[(s0 >> 8) & 0xFF] << 8 | inv_sbox[s3 & 0xFF]) ^ words[k+2]
+		t3 = (inv_sbox[s3 >> 24] << 24 | inv_sbox[(s2 >> 16) & 0xFF] << 16 | inv_sbox[(s1 >> 8) & 0xFF] << 8 | inv_sbox[s0 & 0xFF]) ^ words[k+3]
+
+		return [t0 >> 24, (t0 >> 16) & 0xFF, (t0 >> 8) & 0xFF, t0 & 0xFF,
+				t1 >> 24, (t1 >> 16) & 0xFF, (t1 >> 8) & 0xFF, t1 & 0xFF,
+				t2 >> 24, (t2 >> 16) & 0xFF, (t2 >> 8) & 0xFF, t2 & 0xFF,
+				t3 >> 24, (t3 >> 16) & 0xFF, (t3 >> 8) & 0xFF, t3 & 0xFF]
+
 	# Encrypts a 128 bit input block against the gIVectoren key of size specified
-	def encryptn(self, input, key):
-		size = 16
+	# key - a number array of the key or an ExpandedKey built once for that key
+	# engine - engine of type engines, the engine of the object by default. An object with its own backend uses it when no engine is given
+	def encryptn(self, input, key, engine=None):
+		# Look up the expanded key, it is only computed the first time a key is seen
+		expandedKey = getExpandedKey(key)
+		nbrRounds = expandedKey.nbrRounds
+
+		if(engine is None and self.backend is not None):
+			return list(bytearray(self.backend.function(self, bytes(bytearray(input)), expandedKey, False)))
+
+		if(engine is None):
+			engine = self.engine
+
+		if(engine == self.engines["TTABLE"]):
+			return self.AESTable(input, expandedKey.encWords, nbrRounds)
+
+		if(engine == self.engines["BITSLICE"]):
+			return list(bytearray(self.AESBitslice(bytes(bytearray(input)), expandedKey.expandedKey, nbrRounds)))
+
 		output = [0] * 16
-		# The number of rounds
-		nbrRounds = 0
 		# The 128 bit block to encode
 		block = [0] * 16
-		# Set the number of rounds
-		nbrRounds = 10
-
-		# The expanded keySize
-		expandedkeySize = 16*(nbrRounds+1)
 
 		for i in range(4):
 			# Iterate over the rows
 			for j in range(4):
 				block[(i+(j*4))] = input[(i*4)+j]
 
-		# Expand the key into an 176, 208, 240 bytes key the expanded key
-		expandedKey = self.keyExpand(key, expandedkeySize)
-
-		# Encrypt the block using the expandedKey
-		block = self.AES(block, expandedKey, nbrRounds)
+		# Encrypt the block using the round keys of the expandedKey
+		block = self.AES(block, expandedKey.roundKeys, nbrRounds)
 
 		# Unmap the block again into the output
 		for k in range(4):
@@ -301,25 +431,35 @@ class AES(object):
 		return output
 
 	# Decrypts a 128 bit input block against the gIVectoren key of size specified
-	def decryptn(self, input, key):
+	# key - a number array of the key or an ExpandedKey built once for that key
+	# engine - engine of type engines, the engine of the object by default. An object with its own backend uses it when no engine is given
+	def decryptn(self, input, key, engine=None):
+		# Look up the expanded key, it is only computed the first time a key is seen
+		expandedKey = getExpandedKey(key)
+		nbrRounds = expandedKey.nbrRounds
+
+		if(engine is None and self.backend is not None):
+			return list(bytearray(self.backend.function(self, bytes(bytearray(input)), expandedKey, True)))
+
+		if(engine is None):
+			engine = self.engine
+
+		if(engine == self.engines["TTABLE"]):
+			return self.AESInvTable(input, expandedKey.decWords, nbrRounds)
+
+		if(engine == self.engines["BITSLICE"]):
+			return list(bytearray(self.AESInvBitslice(bytes(bytearray(input)), expandedKey.expandedKey, nbrRounds)))
+
 		output = [0] * 16
-		# The number of rounds
-		nbrRounds = 0
 		# The 128 bit block to decode
 		block = [0] * 16
-		# Set the number of rounds
-		nbrRounds = 10
-		# The expanded keySize
-		expandedkeySize = 16*(nbrRounds+1)
 
 		for i in range(4):
 			# Iterate over the rows
 			for j in range(4):
 				block[(i+(j*4))] = input[(i*4)+j]
-		# Expand the key into an 176, 208, 240 bytes key
-		expandedKey = self.keyExpand(key, expandedkeySize)
-		# Decrypt the block using the expandedKey
-		block = self.AES_Inv(block, expandedKey, nbrRounds)
+		# Decrypt the block using the round keys of the expandedKey
+		block = self.AES_Inv(block, expandedKey.roundKeys, nbrRounds)
 
 		# Unmap the block again into the output
 		for k in range(4):
@@ -328,118 +468,377 @@ class AES(object):
 				output[(k*4)+l] = block[(k+(l*4))]
 		return output
 
-# Handles AES with plainText consistingof multiple blocks. Choice of block encoding modes:  CFB, CBC, OFB
+	# Forward aes on N blocks at once. cols is an (N, 4) uint32 array of column words, every round is a vectorized Te0..Te3 gather over all blocks
+	def AESBlocks(self, cols, words, nbrRounds):
+		Te0, Te1, Te2, Te3, sbox = self.numpyTables["encrypt"]
+		words = numpy.array(words, dtype=numpy.uint32)
+
+		s0 = cols[:, 0] ^ words[0]
+		s1 = cols[:, 1] ^ words[1]
+		s2 = cols[:, 2] ^ words[2]
+		s3 = cols[:, 3] ^ words[3]
+
+		k = 4
+		for i in range(nbrRounds - 1):
+			t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xFF] ^ Te2[(s2 >> 8) & 0xFF] ^ Te3[s3 & 0xFF] ^ words[k]
+			t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xFF] ^ Te2[(s3 >> 8) & 0xFF] ^ Te3[s0 & 0xFF] ^ words[k+1]
+			t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xFF] ^ Te2[(s0 >> 8) & 0xFF] ^ Te3[s1 & 0xFF] ^ words[k+2]
+			t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xFF] ^ Te2[(s1 >> 8) & 0xFF] ^ Te3[s2 & 0xFF] ^ words[k+3]
+			s0, s1, s2, s3 = t0, t1, t2, t3
+			k += 4
+
+		# The final round has no MixColumns, only SubBytes and ShiftRows
+		out = numpy.empty(cols.shape, dtype=numpy.uint32)
+		out[:, 0] = (sbox[s0 >> 24] << 24 | sbox[(s1 >> 16) & 0xFF] << 16 | sbox[(s2 >> 8) & 0xFF] << 8 | sbox[s3 & 0xFF]) ^ words[k]
+		out[:, 1] = (sbox[s1 >> 24] << 24 | sbox[(s2 >> 16) & 0xFF] << 16 | sbox[(s3 >> 8) & 0xFF] << 8 | sbox[s0 & 0xFF]) ^ words[k+1]
+		out[:, 2] = (sbox[s2 >> 24] << 24 | sbox[(s3 >> 16) & 0xFF] << 16 | sbox[(s0 >> 8) & 0xFF] << 8 | sbox[s1 & 0xFF]) ^ words[k+2]
+		out[:, 3] = (sbox[s3 >> 24] << 24 | sbox[(s0 >> 16) & 0xFF] << 16 | sbox[(s1 >> 8) & 0xFF] << 8 | sbox[s2 & 0xFF]) ^ words[k+3]
+
+		return out
+
+	# Equivalent inverse cipher on N blocks at once. cols is an (N, 4) uint32 array of column words
+	def AESInvBlocks(self, cols, words, nbrRounds):
+		Td0, Td1, Td2, Td3, inv_sbox = self.numpyTables["decrypt"]
+		words = numpy.array(words, dtype=numpy.uint32)
+
+		s0 = cols[:, 0] ^ words[0]
+		s1 = cols[:, 1] ^ words[1]
+		s2 = cols[:, 2] ^ words[2]
+		s3 = cols[:, 3] ^ words[3]
+
+		k = 4
+		for i in range(nbrRounds - 1):
+			t0 = Td0[s0 >> 24] ^ Td1[(s3 >> 16) & 0xFF] ^ Td2[(s2 >> 8) & 0xFF] ^ Td3[s1 & 0xFF] ^ words[k]
+			t1 = Td0[s1 >> 24] ^ Td1[(s0 >> 16) & 0xFF] ^ Td2[(s3 >> 8) & 0xFF] ^ Td3[s2 & 0xFF] ^ words[k+1]
+			t2 = Td0[s2 >> 24] ^ Td1[(s1 >> 16) & 0xFF] ^ Td2[(s0 >> 8) & 0xFF] ^ Td3[s3 & 0xFF] ^ words[k+2]
+			t3 = Td0[s3 >> 24] ^ Td1[(s2 >> 16) & 0xFF] ^ Td2[(s1 >> 8) & 0xFF] ^ Td3[s0 & 0xFF] ^ words[k+3]
+			s0, s1, s2, s3 = t0, t1, t2, t3
+			k += 4
+
+		# The final round has no InvMixColumns, only InvSubBytes and InvShiftRows
+		out = numpy.empty(cols.shape, dtype=numpy.uint32)
+		out[:, 0] = (inv_sbox[s0 >> 24] << 24 | inv_sbox[(s3 >> 16) & 0xFF] << 16 | inv_sbox[(s2 >> 8) & 0xFF] << 8 | inv_sbox[s1 & 0xFF]) ^ words[k]
+		out[:, 1] = (inv_sbox[s1 >> 24] << 24 | inv_sbox[(s0 >> 16) & 0xFF] << 16 | inv_sbox[(s3 >> 8) & 0xFF] << 8 | inv_sbox[s2 & 0xFF]) ^ words[k+1]
+		out[:, 2] = (inv_sbox[s2 >> 24] << 24 | inv_sbox[(s1 >> 16) & 0xFF] << 16 | inv_sbox[(s0 >> 8) & 0xFF] << 8 | inv_sbox[s3 & 0xFF]) ^ words[k+2]
+		out[:, 3] = (inv_sbox[s3 >> 24] << 24 | inv_sbox[(s2 >> 16) & 0xFF] << 16 | inv_sbox[(s1 >> 8) & 0xFF] << 8 | inv_sbox[s0 & 0xFF]) ^ words[k+3]
+
+		return out
+
+	# Forward aes on N blocks at once, bitsliced. data is a string of N*16 bytes
+	# SubBytes, ShiftRows and MixColumns are the same AND/XOR/shift network for any N, so the cost per block falls as N grows
+	def AESBitslice(self, data, expandedKey, nbrRounds):
+		masks = getBitsliceMasks(len(data) // 16)
+		keys = roundKeyPlanes(expandedKey, nbrRounds, masks)
+		planes = [plane ^ key for plane, key in zip(bitsliceBlocks(data, masks), keys[0])]
+
+		for i in range(1, nbrRounds + 1):
+			planes = planesSubBytes(planes, masks.ones)
+			planes = [permutePlane(plane, masks.shiftRows) for plane in planes]
+
+			# The final round has no MixColumns
+			# MixColumns: 2*a[r] ^ 3*a[r+1] ^ a[r+2] ^ a[r+3] = xtime(t) ^ a[r+1] ^ t[r+2] with t[r] = a[r] ^ a[r+1]
+			if(i < nbrRounds):
+				rotated = [permutePlane(plane, masks.rotate1) for plane in planes]
+				t = [a ^ b for a, b in zip(planes, rotated)]
+				planes = [x ^ b ^ permutePlane(c, masks.rotate2) for x, b, c in zip(planesXtime(t), rotated, t)]
+
+			planes = [plane ^ key for plane, key in zip(planes, keys[i])]
+
+		return unbitsliceBlocks(planes, len(data), masks)
+
+	# Inverse aes on N blocks at once, bitsliced. data is a string of N*16 bytes
+	def AESInvBitslice(self, data, expandedKey, nbrRounds):
+		masks = getBitsliceMasks(len(data) // 16)
+		keys = roundKeyPlanes(expandedKey, nbrRounds, masks)
+		planes = [plane ^ key for plane, key in zip(bitsliceBlocks(data, masks), keys[nbrRounds])]
+
+		for i in range(nbrRounds - 1, -1, -1):
+			planes = [permutePlane(plane, masks.invShiftRows) for plane in planes]
+			planes = planesInvSubBytes(planes, masks.ones)
+			planes = [plane ^ key for plane, key in zip(planes, keys[i])]
+
+			# InvMixColumns is MixColumns after a[r] ^= 4*(a[r] ^ a[r+2]), the first round has none
+			if(i > 0):
+				u = planesXtime(planesXtime([a ^ permutePlane(a, masks.rotate2) for a in planes]))
+				planes = [a ^ b for a, b in zip(planes, u)]
+				rotated = [permutePlane(plane, masks.rotate1) for plane in planes]
+				t = [a ^ b for a, b in zip(planes, rotated)]
+				planes = [x ^ b ^ permutePlane(c, masks.rotate2) for x, b, c in zip(planesXtime(t), rotated, t)]
+
+		return unbitsliceBlocks(planes, len(data), masks)
+
+	# Runs the block cipher over N blocks with the selected backend, or the BITSLICE backend when it is the engine of the object
+	# blocks - an (N, 16) uint8 array or a buffer of N*16 bytes
+	# Returns an (N, 16) uint8 array for an array and a string of bytes for a buffer, None if blocks is not a multiple of 16 bytes
+	def processBlocks(self, blocks, key, isInv):
+		expandedKey = getExpandedKey(key)
+
+		isArray = numpy is not None and isinstance(blocks, numpy.ndarray)
+		if(isArray):
+			data = numpy.ascontiguousarray(blocks, dtype=numpy.uint8).tobytes()
+		elif(isinstance(blocks, memoryview)):
+			data = blocks.tobytes()
+		elif(isinstance(blocks, str)):
+			data = blocks
+		else:
+			data = bytes(bytearray(blocks))
 
-	# Converts a 16 character string into a number array
-	def convertString(self, string, start, end, mode):
-		if(end - start > 16):
-			end = start + 16
+		if(len(data) % 16):
+			return None
 
-		if(mode == self.modes["CBC"]):
-			ar = [0] * 16
+		if(self.backend is not None):
+			backend = self.backend
+		elif(self.engine == self.engines["BITSLICE"]):
+			backend = backends["bitslice"]
 		else:
-			ar = []
+			backend = selectedBackend
+
+		out = data
+		if(len(data)):
+			out = backend.function(self, data, expandedKey, isInv)
+
+		if(isArray):
+			return numpy.frombuffer(out, dtype=numpy.uint8).reshape(-1, 16).copy()
+
+		return out
+
+	# Encrypts N independent 128 bit blocks at once
+	# blocks - an (N, 16) uint8 array or a buffer of N*16 bytes
+	# key - a number array of the key or an ExpandedKey
+	def encryptBlocks(self, blocks, key):
+		return self.processBlocks(blocks, key, False)
+
+	# Decrypts N independent 128 bit blocks at once
+	# blocks - an (N, 16) uint8 array or a buffer of N*16 bytes
+	# key - a number array of the key or an ExpandedKey
+	def decryptBlocks(self, blocks, key):
+		return self.processBlocks(blocks, key, True)
+
+# Handles AES with plainText consistingof multiple blocks. Choice of block encoding modes:  CFB, CBC, OFB, CTR
+
+	# Builds `count` consecutive counter blocks as a string of bytes
+	# The IVector is the first counter, read as a 128 bit big-endian number and incremented per block
+	def counterBlocks(self, IVector, start, count):
+		counter = 0
+		for byte in bytearray(IVector):
+			counter = (counter << 8) | byte
+		counter += start
+
+		blocks = []
+		for i in range(count):
+			c = (counter + i) & 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+			blocks.append(struct.pack(">QQ", c >> 64, c & 0xFFFFFFFFFFFFFFFF))
+
+		return b"".join(blocks)
+
+	# Generates the CTR keystream of blocks start to start+count as a string of bytes
+	# Every keystream block only depends on the key and its counter, so the blocks are encrypted together
+	def counterKeystream(self, key, IVector, start, count):
+		return self.encryptBlocks(self.counterBlocks(IVector, start, count), key)
+
+	# CTR mode, encryption and decryption are the same XOR with the keystream
+	# data - a string of bytes or a number array
+	# Returns the result as a number array
+	def counterMode(self, data, key, IVector):
+		data = bytearray(asBuffer(data))
+		out = []
+		batchSize = 16 * self.counterBatch
+
+		for start in range(0, len(data), batchSize):
+			chunk = data[start : start+batchSize]
+			keystream = self.counterKeystream(key, IVector, start // 16, (len(chunk) + 15) // 16)
+			out.extend(bytearray(xorBytes(chunk, keystream)))
+
+		return out
+
+	# CBC and CFB decryption split into chunks that overlap by one block
+	# Every cipher text block is known, so the chunks are decrypted independently by decryptChunk, in `pool` when one is given
+	# cipherIn - the cipher text as a string of bytes
+	# pool - an optional multiprocessing pool
+	def decryptChunks(self, cipherIn, mode, key, IVector, pool=None):
+		IVector = bytes(bytearray(IVector))
+		chunkSize = 16 * self.chunkBlocks
+		tasks = []
+
+		for start in range(0, len(cipherIn), chunkSize):
+			# The cipher block before the chunk, the IVector for the first one
+			if(start == 0):
+				previous = IVector
+			else:
+				previous = cipherIn[start-16 : start]
+			tasks.append((key.key, mode, previous, cipherIn[start : start+chunkSize], self.engine, self.backend and self.backend.name))
 
-		i = start
-		j = 0
+		# Without a pool the chunks are decrypted by this object, a worker makes an AES object of the same engine and backend
+		if(pool is None):
+			results = [self.decryptChunkBlocks(*task[:4]) for task in tasks]
+		else:
+			results = pool.map(decryptChunk, tasks)
 
-		while(len(ar) < end - start):
-			ar.append(0)
+		return b"".join(results)
 
-		while(i < end):
-			ar[j] = ord(string[i])
-			j += 1
-			i += 1
+	# Decrypts one chunk of CBC or CFB cipher text with the engine and the backend of the object
+	# previous - the cipher block before the chunk
+	def decryptChunkBlocks(self, key, mode, previous, chunk):
+		if(mode == self.modes["CBC"]):
+			# Plain block i is the decrypted block i XOR cipher block i-1
+			return xorBytes(self.decryptBlocks(chunk, key), previous + chunk[:-16])
+
+		# CFB: plain block i is cipher block i XOR the encrypted cipher block i-1
+		inputs = (previous + chunk)[: 16 * ((len(chunk) + 15) // 16)]
+		return xorBytes(chunk, self.encryptBlocks(inputs, key))
+
+	# Mode of Operation Encryption into a preallocated buffer, with no copy of the message between blocks
+	# data - the plain text as any buffer (str, bytearray, memoryview)
+	# out - a writable bytearray or memoryview, at least len(data) bytes long, rounded up to 16 for CBC, plus 16 for the GCM tag. It can be data itself
+	# A partial last CBC block is padded with zeros, like encrypt does
+	# associatedData - the data authenticated by the GCM tag without being encrypted
+	# Returns the number of bytes written
+	def encryptInto(self, data, out, mode, key, IVector, associatedData=b""):
+		data = memoryview(asBuffer(data))
+		out = memoryview(out)
+		chunkSize = 16 * self.chunkBlocks
+
+		stream = MessageEncryptor(key, mode, IVector, associatedData)
+		stream.aes = self
+		# The IVector is not part of the output
+		stream.header = b""
+		written = 0
+
+		for start in range(0, len(data), chunkSize):
+			result = stream.update(data[start : start+chunkSize])
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		if(mode == self.modes["GCM"]):
+			result = stream.finalize()
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		elif(len(stream.buffer)):
+			if(mode == self.modes["CBC"]):
+				stream.buffer += bytearray(16 - len(stream.buffer))
+				result = stream.chainBlocks(stream.takeBlocks(0))
+			else:
+				result = stream.finalizePartial()
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		return written
+
+	# Mode of Operation Decryption into a preallocated buffer, with no copy of the message between blocks
+	# data - the cipher text without the IVector as any buffer, followed by the tag in GCM mode
+	# out - a writable bytearray or memoryview, at least len(data) bytes long. It can be data itself
+	# pool - an optional multiprocessing pool for the CBC and CFB chunks
+	# associatedData - the data authenticated by the GCM tag
+	# GCM raises ValueError when the tag does not match, what was written to out is then not authentic
+	# Returns the number of bytes written
+	def decryptInto(self, data, out, mode, key, IVector, pool=None, associatedData=b""):
+		data = memoryview(asBuffer(data))
+		out = memoryview(out)
+		chunkSize = 16 * self.chunkBlocks
+
+		if(pool is not None and mode in (self.modes["CBC"], self.modes["CFB"])):
+			result = self.decryptChunks(data.tobytes(), mode, getExpandedKey(key), IVector, pool)
+			out[:len(result)] = result
+			return len(result)
+
+		stream = MessageDecryptor(key, mode, associatedData)
+		stream.aes = self
+		stream.setIVector(IVector)
+		written = 0
+
+		for start in range(0, len(data), chunkSize):
+			if(mode == self.modes["GCM"]):
+				result = stream.update(data[start : start+chunkSize])
+			else:
+				stream.buffer += bytearray(data[start : start+chunkSize])
+				if(mode in (self.modes["CBC"], self.modes["CFB"])):
+					result = stream.chainBlocks(stream.takeBlocks(0))
+				else:
+					result = stream.keystreamBlocks(stream.takeBlocks(0), False)
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		if(mode == self.modes["GCM"]):
+			result = stream.finalize()
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		elif(len(stream.buffer)):
+			result = stream.finalizePartial()
+			out[written : written+len(result)] = result
+			written += len(result)
+
+		return written
+
+	# Converts a string of bytes into a number array
+	def convertBytes(self, string):
+		return list(bytearray(string))
 
-		return ar
+	# Converts a number array or any buffer into a string of bytes
+	def convertNumbers(self, numbers):
+		if(not isinstance(numbers, bytearray)):
+			numbers = bytearray(asBuffer(numbers))
+
+		return bytes(numbers)
 
 	# Mode of Operation Encryption
 	# stringIn - Input String
 	# mode - mode of type modes
-	# hexKey - a hex key of the bit length size
-	# hexIVector - the 128 bit hex Initilization Vector
+	# key - a number array of the bit length size or an ExpandedKey
+	# IVector - the 128 bit number array Initilization Vector
 	def encrypt(self, stringIn, mode, key, IVector):
-		aes = AES()
 		size = 16
-		if(len(key) % size):
-			return None
+		if(not isinstance(key, ExpandedKey)):
+			if(len(key) % size):
+				return None
+			# Expand the key once for the whole message
+			key = getExpandedKey(key)
 
 		if(len(IVector) % 16):
 			return None
-		# The AES input/output
-		plainText = []
-		input = [0] * 16
-		output = []
-		cipherText = [0] * 16
-		# The output cipher string
+
+		# Any other buffer is read as a string of bytes
+		if(stringIn != None and not isinstance(stringIn, str)):
+			stringIn = memoryview(asBuffer(stringIn)).tobytes()
+
+		# The output cipher number array
 		cipherOut = []
-		# Char firstRound
-		firstRound = True
-		if(stringIn != None):
-			for j in range(int(math.ceil(float(len(stringIn))/16))):
-				start = j*16
-				end = j*16+16
-
-				if(end > len(stringIn)):
-					end = len(stringIn)
-
-				plainText = self.convertString(stringIn, start, end, mode)
-
-				if(mode == self.modes["CFB"]):
-					if(firstRound == True):
-						output = self.encryptn(IVector, key)
-						firstRound = False
-					else:
-						output = self.encryptn(input, key)
-
-					for i in range(16):
-						if(len(plainText)-1 < i):
-							cipherText[i] = self.xor(0, output[i])
-						elif(len(output)-1 < i):
-							cipherText[i] = self.xor(plainText[i], 0)
-						elif(len(plainText)-1 < i and len(output) < i):
-							cipherText[i] = self.xor(0, 0)
-						else:
-							cipherText[i] = self.xor(plainText[i], output[i])
-
-					for k in range(end-start):
-						cipherOut.append(cipherText[k])
-					input = cipherText
-
-				elif mode == self.modes["OFB"]:
-					if firstRound:
-						output = self.encryptn(IVector, key)
-						firstRound = False
+		if(stringIn != None and mode == self.modes["CTR"]):
+			cipherOut = self.counterMode(stringIn, key, IVector)
+
+		elif(stringIn != None and mode == self.modes["GCM"]):
+			# The cipher text followed by the tag
+			cipherOut = bytearray(len(stringIn) + 16)
+			self.encryptInto(stringIn, cipherOut, mode, key, IVector)
+			cipherOut = list(cipherOut)
+
+		elif(stringIn != None):
+			# Every block is XORed as one 128 bit number, only the last CFB or OFB block can be partial
+			# CBC encrypts a last partial block padded with zeros
+			data = stringIn
+			if(mode == self.modes["CBC"] and len(data) % 16):
+				data += "\0" * (16 - len(data) % 16)
+
+			feedback = bytearray(IVector)
+			blocks = []
+			for start in range(0, len(data), 16):
+				block = data[start : start+16]
+
+				if(mode == self.modes["CBC"]):
+					feedback = bytearray(self.encryptn(bytearray(xorBlock(block, feedback)), key))
+					blocks.append(bytes(feedback))
+				else:
+					output = bytearray(self.encryptn(feedback, key))
+					cipherText = xorBlock(block, output)
+					blocks.append(cipherText)
+
+					if(mode == self.modes["OFB"]):
+						feedback = output
 					else:
-						output = self.encryptn(input, key)
-
-					for i in range(16):
-						if(len(plainText)-1 < i):
-							cipherText[i] = self.xor(0, output[i])
-						elif(len(output)-1 < i):
-							cipherText[i] = self.xor(plainText[i], 0)
-						elif(len(plainText)-1 < i and len(output) < i):
-							cipherText[i] = self.xor(0, 0)
-						else:
-							cipherText[i] = self.xor(plainText[i], output[i])
-
-					for k in range(end-start):
-						cipherOut.append(cipherText[k])
-					input = output
-
-				elif mode == self.modes["CBC"]:
-					for i in range(16):
-						if(firstRound == True):
-							input[i] =  self.xor(plainText[i], IVector[i])
-						else:
-							input[i] =  self.xor(plainText[i], cipherText[i])
-
-					firstRound = False
-					cipherText = self.encryptn(input, key)
-
-					# Always 16 bytes because of the padding for CBC
-					for k in range(16):
-						cipherOut.append(cipherText[k])
+						feedback = bytearray(cipherText)
+
+			cipherOut = self.convertBytes(b"".join(blocks))
 
 		return mode, len(stringIn), cipherOut
 
@@ -447,138 +846,1555 @@ class AES(object):
 	# cipherIn - Encrypted String
 	# originalsize - The unencrypted string length - required for CBC
 	# mode - mode of type modes
-	# key - a number array of the bit length size
+	# key - a number array of the bit length size or an ExpandedKey
 	# IVector - the 128 bit number array Initilization Vector
-	def decrypt(self, cipherIn, originalsize, mode, key, IVector):
+	# pool - an optional multiprocessing pool for the CBC and CFB chunks
+	def decrypt(self, cipherIn, originalsize, mode, key, IVector, pool=None):
 		size = 16
 
-		if(len(key) % size):
-			return None
+		if(not isinstance(key, ExpandedKey)):
+			if(len(key) % size):
+				return None
+			# Expand the key once for the whole message
+			key = getExpandedKey(key)
 
 		if(len(IVector) % 16):
 			return None
-		# The AES input/output
-		cipherText = []
-		input = []
-		output = []
-		plainText = [0] * 16
-		# The output plain text character list
-		charList = []
-		# Char firstRound
-		firstRound = True
-		if(cipherIn != None):
-			for j in range(int(math.ceil(float(len(cipherIn))/16))):
-				start = j*16
-				end = j*16+16
-
-				if(j*16+16 > len(cipherIn)):
-					end = len(cipherIn)
-				cipherText = cipherIn[start : end]
-
-				if(mode == self.modes["CFB"]):
-					if(firstRound == True):
-						output = self.encryptn(IVector, key)
-						firstRound = False
-					else:
-						output = self.encryptn(input, key)
-
-					for i in range(16):
-						if(len(output)-1 < i):
-							plainText[i] = self.xor(0, cipherText[i])
-						elif(len(cipherText)-1 < i):
-							plainText[i] = self.xor(output[i], 0)
-						elif(len(output)-1 < i and len(cipherText) < i):
-							plainText[i] = self.xor(0, 0)
-						else:
-							plainText[i] = self.xor(output[i], cipherText[i])
-
-					for k in range(end-start):
-						charList.append(chr(plainText[k]))
-					input = cipherText
-
-				elif mode == self.modes["OFB"]:
-					if firstRound:
-						output = self.encryptn(IVector, key)
-						firstRound = False
-					else:
-						output = self.encryptn(input, key)
-
-					for i in range(16):
-						if(len(output)-1 < i):
-							plainText[i] = self.xor(0, cipherText[i])
-						elif(len(cipherText)-1 < i):
-							plainText[i] = self.xor(output[i], 0)
-						elif(len(output)-1 < i and len(cipherText) < i):
-							plainText[i] = self.xor(0, 0)
-						else:
-							plainText[i] = self.xor(output[i], cipherText[i])
-
-					for k in range(end-start):
-						charList.append(chr(plainText[k]))
-					input = output
-
-				elif(mode == self.modes["CBC"]):
-					output = self.decryptn(cipherText, key)
-
-					for i in range(16):
-						if(firstRound == True):
-							plainText[i] = self.xor(IVector[i], output[i])
-						else:
-							plainText[i] = self.xor(input[i], output[i])
-
-					firstRound = False
-					if(originalsize is not None and originalsize < end):
-						for k in range(originalsize-start):
-							charList.append(chr(plainText[k]))
-					else:
-						for k in range(end-start):
-							charList.append(chr(plainText[k]))
 
-					input = cipherText
-		return "".join(charList)
+		if(cipherIn == None):
+			return ""
+
+		# A number array or any buffer is read as a string of bytes
+		data = self.convertNumbers(cipherIn)
+
+		# CBC and CFB decryption does not chain, only the BYTE reference engine decrypts them block by block
+		if(mode in (self.modes["CBC"], self.modes["CFB"]) and self.engine != self.engines["BYTE"]):
+			plainText = self.decryptChunks(data, mode, key, IVector, pool)
+
+			if(mode == self.modes["CBC"] and originalsize is not None):
+				plainText = plainText[:originalsize]
+
+			return plainText
+
+		if(mode == self.modes["CTR"]):
+			return "".join(map(chr, self.counterMode(data, key, IVector)))
+
+		# The tag is checked, ValueError is raised when it does not match
+		if(mode == self.modes["GCM"]):
+			plainText = bytearray(max(0, len(data) - 16))
+			self.decryptInto(data, plainText, mode, key, IVector)
+			return bytes(plainText)
+
+		# Every block is XORed as one 128 bit number, only the last CFB or OFB block can be partial
+		feedback = bytearray(IVector)
+		blocks = []
+		for start in range(0, len(data), 16):
+			cipherText = data[start : start+16]
+
+			if(mode == self.modes["CBC"]):
+				blocks.append(xorBlock(bytearray(self.decryptn(bytearray(cipherText), key)), feedback))
+				feedback = bytearray(cipherText)
+			else:
+				output = bytearray(self.encryptn(feedback, key))
+				blocks.append(xorBlock(cipherText, output))
+
+				if(mode == self.modes["OFB"]):
+					feedback = output
+				else:
+					feedback = bytearray(cipherText)
+
+		plainText = "".join(blocks)
+		if(mode == self.modes["CBC"] and originalsize is not None):
+			plainText = plainText[:originalsize]
+
+		return plainText
+
+# Rotate a 32-bit word 8 bits to the right
+def rotateWord(word):
+	return ((word >> 8) | (word << 24)) & 0xFFFFFFFF
+
+# Build the GF(2^8) multiplication tables of the coefficients used by MixColumns and its inverse
+# mulTables[c][x] is the product of x and c
+def buildMultiplyTables():
+	g = AES().multiple
+	mulTables = {}
+
+	for c in (1, 2, 3, 9, 11, 13, 14):
+		mulTables[c] = [g(x, c) for x in range(256)]
+
+	return mulTables
+
+AES.mulTables = buildMultiplyTables()
+
+# Build the Te0..Te3 tables of the TTABLE engine
+# Te0[x] is the MixColumns column of the S-box value of x, Te1..Te3 are its byte rotations for the other rows
+def buildEncryptionTables():
+	mul2 = AES.mulTables[2]
+	mul3 = AES.mulTables[3]
+	Te0 = []
+
+	for x in range(256):
+		s = AES.sbox[x]
+		Te0.append(mul2[s] << 24 | s << 16 | s << 8 | mul3[s])
+
+	Te1 = [rotateWord(w) for w in Te0]
+	Te2 = [rotateWord(w) for w in Te1]
+	Te3 = [rotateWord(w) for w in Te2]
+
+	return Te0, Te1, Te2, Te3
+
+# Build the Td0..Td3 tables of the equivalent inverse cipher
+# Td0[x] is the InvMixColumns column of the inverted S-box value of x, Td1..Td3 are its byte rotations for the other rows
+def buildDecryptionTables():
+	mul = AES.mulTables
+	Td0 = []
+
+	for x in range(256):
+		s = AES.inv_sbox[x]
+		Td0.append(mul[14][s] << 24 | mul[9][s] << 16 | mul[13][s] << 8 | mul[11][s])
+
+	Td1 = [rotateWord(w) for w in Td0]
+	Td2 = [rotateWord(w) for w in Td1]
+	Td3 = [rotateWord(w) for w in Td2]
+
+	return Td0, Td1, Td2, Td3
+
+# Apply InvMixColumns to a 32-bit round key word. The S-box cancels the inverted S-box inside the Td tables
+def invMixWord(word):
+	sbox = AES.sbox
+	return (AES.Td0[sbox[word >> 24]] ^ AES.Td1[sbox[(word >> 16) & 0xFF]] ^
+			AES.Td2[sbox[(word >> 8) & 0xFF]] ^ AES.Td3[sbox[word & 0xFF]])
+
+AES.Te0, AES.Te1, AES.Te2, AES.Te3 = buildEncryptionTables()
+AES.Td0, AES.Td1, AES.Td2, AES.Td3 = buildDecryptionTables()
+
+# The tables of the multi-block engine as NumPy arrays
+if(numpy is not None):
+	AES.numpyTables = dict(
+		encrypt=[numpy.array(t, dtype=numpy.uint32) for t in (AES.Te0, AES.Te1, AES.Te2, AES.Te3, AES.sbox)],
+		decrypt=[numpy.array(t, dtype=numpy.uint32) for t in (AES.Td0, AES.Td1, AES.Td2, AES.Td3, AES.inv_sbox)])
+
+# Bitsliced state of the BITSLICE engine
+# The bytes of N blocks are held in 8 big integers, plane j holds bit j of every byte: bit 16*n + p of a plane is byte p of block n
+# Every operation of a round is then a few AND/XOR/shift operations on the planes, done for all the blocks at once
+
+# Returns the GF(2^8) linear map x -> x^(2^times) as the input bits of every output bit
+def buildSquareRows(times):
+	g = AES().multiple
+	rows = [[] for k in range(8)]
+
+	for i in range(8):
+		value = 1 << i
+		for t in range(times):
+			value = g(value, value)
+		for k in range(8):
+			if(value >> k & 1):
+				rows[k].append(i)
+
+	return rows
+
+AES.squareRows = dict((times, buildSquareRows(times)) for times in (1, 2, 4))
+
+# Applies a linear map of buildSquareRows to the planes
+def planesLinear(planes, rows):
+	out = []
+
+	for row in rows:
+		value = 0
+		for i in row:
+			value ^= planes[i]
+		out.append(value)
+
+	return out
+
+# GF(2^8) product of two bitsliced values, the schoolbook product reduced by x^8 = x^4 + x^3 + x + 1
+def planesMultiply(a, b):
+	c = [0] * 15
+
+	for i in range(8):
+		ai = a[i]
+		for j in range(8):
+			c[i+j] ^= ai & b[j]
+
+	for k in range(14, 7, -1):
+		ck = c[k]
+		c[k-8] ^= ck
+		c[k-7] ^= ck
+		c[k-5] ^= ck
+		c[k-4] ^= ck
+
+	return c[:8]
+
+# GF(2^8) inversion of the planes as x^254, with 0 mapped to 0 like in the S-box
+def planesInverse(x):
+	squareRows = AES.squareRows
+	x2 = planesLinear(x, squareRows[1])
+	x3 = planesMultiply(x2, x)
+	x12 = planesLinear(x3, squareRows[2])
+	x14 = planesMultiply(x12, x2)
+	x15 = planesMultiply(x12, x3)
+	x240 = planesLinear(x15, squareRows[4])
+
+	return planesMultiply(x240, x14)
+
+# SubBytes of the planes: the inversion followed by the affine map of the S-box
+def planesSubBytes(planes, ones):
+	b = planesInverse(planes)
+	out = []
+
+	for i in range(8):
+		value = b[i] ^ b[(i+4) % 8] ^ b[(i+5) % 8] ^ b[(i+6) % 8] ^ b[(i+7) % 8]
+		if(0x63 >> i & 1):
+			value ^= ones
+		out.append(value)
+
+	return out
+
+# InvSubBytes of the planes: the inverse affine map followed by the inversion
+def planesInvSubBytes(planes, ones):
+	b = []
+
+	for i in range(8):
+		value = planes[(i+2) % 8] ^ planes[(i+5) % 8] ^ planes[(i+7) % 8]
+		if(0x05 >> i & 1):
+			value ^= ones
+		b.append(value)
+
+	return planesInverse(b)
+
+# Multiplication of the planes by x, the xtime of MixColumns
+def planesXtime(a):
+	return [a[7], a[0] ^ a[7], a[1], a[2] ^ a[7], a[3] ^ a[7], a[4], a[5], a[6]]
+
+# Moves bits inside every block of a plane. moves is a list of (mask, shift) built by BitsliceMasks
+def permutePlane(plane, moves):
+	out = 0
+
+	for mask, shift in moves:
+		if(shift >= 0):
+			out |= (plane & mask) << shift
+		else:
+			out |= (plane & mask) >> -shift
+
+	return out
+
+# The masks of the BITSLICE engine for N blocks
+class BitsliceMasks(object):
+
+	def __init__(self, count):
+		# Repeats a 16 bit pattern in every block
+		self.replicate = ((1 << (16*count)) - 1) // 0xFFFF
+		self.ones = (1 << (16*count)) - 1
+		# Byte p = 4*column + row of the new state comes from byte source(p) of the old one
+		self.shiftRows = self.moves(lambda p: 4 * ((p//4 + p%4) % 4) + p%4)
+		self.invShiftRows = self.moves(lambda p: 4 * ((p//4 - p%4) % 4) + p%4)
+		# Row r of a column gets the byte of row r+1 or r+2 of the same column
+		self.rotate1 = self.moves(lambda p: 4 * (p//4) + (p+1) % 4)
+		self.rotate2 = self.moves(lambda p: 4 * (p//4) + (p+2) % 4)
+		# The 64 bit lane masks of the 8x8 bit transpose in bitsliceBlocks
+		lanes = ((1 << (16*8*count)) - 1) // 0xFFFFFFFFFFFFFFFF
+		self.transpose = [(7, 0x00AA00AA00AA00AA * lanes), (14, 0x0000CCCC0000CCCC * lanes), (28, 0x00000000F0F0F0F0 * lanes)]
+
+	# Groups the byte moves of a permutation by shift
+	def moves(self, source):
+		masks = {}
+
+		for p in range(16):
+			shift = p - source(p)
+			masks[shift] = masks.get(shift, 0) | 1 << source(p)
+
+		return [(mask * self.replicate, shift) for shift, mask in sorted(masks.items())]
+
+# The masks of the last block counts used, shared by the threads that run the bitsliced engine
+bitsliceMasksCache = OrderedDict()
+bitsliceMasksLock = threading.Lock()
+
+def getBitsliceMasks(count):
+	with bitsliceMasksLock:
+		masks = bitsliceMasksCache.pop(count, None)
+		if(masks is not None):
+			bitsliceMasksCache[count] = masks
+			return masks
+
+	masks = BitsliceMasks(count)
+
+	with bitsliceMasksLock:
+		bitsliceMasksCache[count] = masks
+		while(len(bitsliceMasksCache) > 8):
+			bitsliceMasksCache.popitem(False)
+
+	return masks
+
+# Transposes the bits inside every 8 bytes of x: bit i of byte j goes to bit j of byte i
+def transposeLanes(x, masks):
+	for shift, mask in masks.transpose:
+		t = (x ^ (x >> shift)) & mask
+		x ^= t ^ (t << shift)
+
+	return x
+
+# Splits a string of N blocks into the 8 planes
+def bitsliceBlocks(data, masks):
+	size = len(data)
+	x = transposeLanes(int(binascii.hexlify(data[::-1]), 16), masks)
+	lanes = binascii.unhexlify("%0*x" % (2*size, x))[::-1]
+
+	# Byte j of every 8 byte lane now holds bit j of the 8 bytes of the lane
+	return [int(binascii.hexlify(lanes[j::8][::-1]), 16) for j in range(8)]
+
+# Joins the 8 planes back into a string of `size` bytes
+def unbitsliceBlocks(planes, size, masks):
+	lanes = bytearray(size)
+
+	for j in range(8):
+		lanes[j::8] = binascii.unhexlify("%0*x" % (size // 4, planes[j]))[::-1]
+
+	x = transposeLanes(int(binascii.hexlify(bytes(lanes)[::-1]), 16), masks)
+
+	return binascii.unhexlify("%0*x" % (2*size, x))[::-1]
+
+# The planes of the round key of every round, repeated for every block
+def roundKeyPlanes(expandedKey, nbrRounds, masks):
+	planes = []
+
+	for i in range(nbrRounds + 1):
+		roundKey = expandedKey[16*i : 16*i+16]
+		planes.append([sum(((roundKey[p] >> j) & 1) << p for p in range(16)) * masks.replicate for j in range(8)])
+
+	return planes
+
+# Returns `data` as an object with the buffer protocol
+# Text keeps the ordinal of every character as one byte, as the number arrays of the AES class did, a character above 255 raises ValueError
+# A list or tuple of numbers or characters becomes a string of bytes
+def asBuffer(data):
+	if(isinstance(data, unicode)):
+		return data.encode("latin-1")
+
+	if(isinstance(data, (list, tuple))):
+		return bytes(bytearray(data))
+
+	return data
+
+# XOR a block of up to 16 bytes with the first bytes of a 16 byte block, both read as one big-endian number
+def xorBlock(block, keystream):
+	size = len(block)
+	number = int(binascii.hexlify(block), 16) ^ (int(binascii.hexlify(keystream), 16) >> (8 * (16 - size)))
+
+	return binascii.unhexlify("%0*x" % (2*size, number))
+
+# XOR two strings of bytes, the result has the length of the shorter one
+def xorBytes(left, right):
+	size = min(len(left), len(right))
+
+	if(numpy is not None):
+		left = numpy.frombuffer(bytes(left[:size]), dtype=numpy.uint8)
+		right = numpy.frombuffer(bytes(right[:size]), dtype=numpy.uint8)
+		return (left ^ right).tobytes()
+
+	return bytes(bytearray([a ^ b for a, b in zip(bytearray(left[:size]), bytearray(right[:size]))]))
+
+# Decrypts one chunk of CBC or CFB cipher text, in a worker
+# task - (key, mode, previous, chunk) where previous is the cipher block before the chunk, optionally followed by the engine
+# and the name of the backend of the AES object that made the task
+def decryptChunk(task):
+	key, mode, previous, chunk = task[:4]
+	engine, backendName = (tuple(task[4:]) + (None, None))[:2]
+	aes = AES(engine, backends.get(backendName))
+
+	return aes.decryptChunkBlocks(key, mode, previous, chunk)
+
+# Expanded key schedule of a 128 bit key. It is built once per key and holds the round keys already transposed into the state layout
+class ExpandedKey(object):
+
+	def __init__(self, key):
+		aes = AES()
+		# The number of rounds
+		self.nbrRounds = 10
+		# The key as a byte string, used as the cache key
+		self.key = bytes(bytearray(key))
+		# Expand the key into an 176 bytes key
+		self.expandedKey = aes.keyExpand(list(bytearray(key)), 16*(self.nbrRounds+1))
+		# One round key for each round, as createRoundKey would build it
+		self.roundKeys = [aes.createRoundKey(self.expandedKey, 16*i) for i in range(self.nbrRounds+1)]
+		# The expanded key as big-endian 32-bit words, used by the TTABLE engine
+		ek = self.expandedKey
+		self.encWords = [ek[i] << 24 | ek[i+1] << 16 | ek[i+2] << 8 | ek[i+3] for i in range(0, len(ek), 4)]
+		# The round keys of the equivalent inverse cipher, last round first with InvMixColumns applied to the inner rounds
+		words = self.encWords
+		self.decWords = list(words[4*self.nbrRounds : 4*self.nbrRounds+4])
+		for i in range(self.nbrRounds - 1, 0, -1):
+			self.decWords += [invMixWord(w) for w in words[4*i : 4*i+4]]
+		self.decWords += words[0:4]
+
+# Bounded LRU cache of expanded keys, keyed by the key bytes
+class KeyCache(object):
+
+	def __init__(self, maxsize=256):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	# Returns the ExpandedKey of `key`, expanding it only on a miss
+	def get(self, key):
+		keyBytes = bytes(bytearray(key))
+
+		with self.lock:
+			expandedKey = self.entries.pop(keyBytes, None)
+			if(expandedKey is not None):
+				self.hits += 1
+				# Move the key to the most recently used end
+				self.entries[keyBytes] = expandedKey
+				return expandedKey
+			self.misses += 1
+
+		expandedKey = ExpandedKey(keyBytes)
+
+		with self.lock:
+			self.entries[keyBytes] = expandedKey
+			# Drop the least recently used keys
+			while(len(self.entries) > self.maxsize):
+				self.entries.popitem(last=False)
+
+		return expandedKey
+
+	# Removes every cached key and resets the counters
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+	# Returns the counters of the cache
+	def stats(self):
+		with self.lock:
+			return dict(hits=self.hits, misses=self.misses, size=len(self.entries), maxsize=self.maxsize)
+
+# The key cache shared by every AES object
+keyCache = KeyCache()
+
+# Returns the ExpandedKey of `key`. `key` can be a string of bytes, a number array or an ExpandedKey
+def getExpandedKey(key):
+	if(isinstance(key, ExpandedKey)):
+		return key
+
+	return keyCache.get(key)
 
 # Generates a key from random input of length `keySize`. The returned key is a string of bytes.  
 def generateRandomKey():
 
 	return os.urandom(16)
 
-# Encrypt `input` using `key` AND `key` should be a string of bytes. Returned cipher is a string of bytes prepended with the initialization vector.
-def encryptMessage(key, input, mode):
-	key = map(ord, key)
+# Block backends of processBlocks
+# A backend runs the block cipher over a string of N*16 bytes as function(aes, data, expandedKey, isInv) and returns the string of the result
+class Backend(object):
 
-	# Return s padded to a multiple of 16-bytes by PKCS7 padding
-	if(mode == AES.modes["CBC"]):
-		numpads = 16 - (len(input)%16)
-		input += numpads*chr(numpads)
+	def __init__(self, name, function, unavailable=None):
+		self.name = name
+		self.function = function
+		# None when the backend can be used, otherwise the reason it cannot
+		self.unavailable = unavailable
+
+# The registered backends, in order of preference
+backends = OrderedDict()
+
+# The backend used by processBlocks, chosen at import by selectBackend
+selectedBackend = None
+
+# Every block one by one through the TTABLE engine
+def backendTable(aes, data, expandedKey, isInv):
+	if(isInv == True):
+		blockFunction = aes.AESInvTable
+		words = expandedKey.decWords
+	else:
+		blockFunction = aes.AESTable
+		words = expandedKey.encWords
+
+	out = bytearray(data)
+	for i in range(0, len(out), 16):
+		out[i:i+16] = bytearray(blockFunction(out[i:i+16], words, expandedKey.nbrRounds))
+
+	return bytes(out)
+
+# All the blocks together through the BITSLICE engine
+def backendBitslice(aes, data, expandedKey, isInv):
+	if(isInv == True):
+		return aes.AESInvBitslice(data, expandedKey.expandedKey, expandedKey.nbrRounds)
+
+	return aes.AESBitslice(data, expandedKey.expandedKey, expandedKey.nbrRounds)
+
+# Pure Python: large batches through the BITSLICE engine, small ones through TTABLE
+def backendPython(aes, data, expandedKey, isInv):
+	if(len(data) >= 16 * aes.bitsliceMinBlocks):
+		return backendBitslice(aes, data, expandedKey, isInv)
+
+	return backendTable(aes, data, expandedKey, isInv)
+
+# Large batches through the NumPy engine, small ones through TTABLE
+def backendNumpy(aes, data, expandedKey, isInv):
+	if(len(data) < 16 * aes.numpyMinBlocks):
+		return backendTable(aes, data, expandedKey, isInv)
+
+	# Big-endian column words, the same layout as the TTABLE engine
+	cols = numpy.frombuffer(data, dtype=">u4").astype(numpy.uint32).reshape(-1, 4)
+
+	if(isInv == True):
+		out = aes.AESInvBlocks(cols, expandedKey.decWords, expandedKey.nbrRounds)
+	else:
+		out = aes.AESBlocks(cols, expandedKey.encWords, expandedKey.nbrRounds)
+
+	return out.astype(">u4").tobytes()
+
+# The blocks of probeBackend and their encryption by the BYTE reference engine, built by the first probe
+probeBlocks = []
+
+# Compares a backend with the BYTE reference engine
+# The probe has enough blocks to reach the multi-block engines of the backends
+# Returns None when they match, otherwise the reason they do not
+def probeBackend(function):
+	aes = AES(AES.engines["BYTE"])
+	expandedKey = ExpandedKey(range(16))
+
+	if(not probeBlocks):
+		data = bytes(bytearray(i % 253 for i in range(16 * max(AES.bitsliceMinBlocks, AES.numpyMinBlocks))))
+		reference = b"".join(bytes(bytearray(aes.encryptn(list(bytearray(data[i:i+16])), expandedKey))) for i in range(0, len(data), 16))
+		probeBlocks[:] = [data, reference]
+
+	data, reference = probeBlocks
+
+	try:
+		if(function(aes, data, expandedKey, False) != reference or function(aes, reference, expandedKey, True) != data):
+			return "its output differs from the reference engine"
+	except Exception as error:
+		return "it failed: %s" % error
+
+	return None
+
+# Adds a backend. It is only available when it gives the same blocks as the reference engine
+# unavailable - the reason the backend cannot be used, it is probed when None
+def registerBackend(name, function, unavailable=None):
+	if(unavailable is None):
+		unavailable = probeBackend(function)
+
+	backends[name] = Backend(name, function, unavailable)
+
+	return backends[name]
+
+# Selects the backend of processBlocks by name, the first available one when name is None
+# Raises ValueError for an unknown or unavailable backend
+def selectBackend(name=None):
+	global selectedBackend
+
+	if(name is None):
+		name = [backend.name for backend in backends.values() if backend.unavailable is None][0]
+
+	if(name not in backends):
+		raise ValueError("unknown backend " + name)
+
+	if(backends[name].unavailable is not None):
+		raise ValueError("backend " + name + " is not available, " + backends[name].unavailable)
+
+	selectedBackend = backends[name]
+
+	return name
+
+# Returns the name of the selected backend
+def backendName():
+	return selectedBackend.name
+
+# There is no native backend: native AES libraries use the standard key schedule, whose round constants differ from rcon
+registerBackend("numpy", backendNumpy, None if numpy is not None else "NumPy is not installed")
+registerBackend("python", backendPython)
+registerBackend("bitslice", backendBitslice)
+registerBackend("table", backendTable)
+
+# The AES_BACKEND environment variable overrides the first available backend
+try:
+	selectBackend(os.environ.get("AES_BACKEND") or None)
+except ValueError as error:
+	sys.stderr.write("AES_BACKEND ignored: %s\n" % error)
+	selectBackend()
+
+# Every block one by one through the BYTE reference engine, the backend of checkBackends' reference
+def backendByte(aes, data, expandedKey, isInv):
+	if(isInv == True):
+		blockFunction = aes.decryptn
+	else:
+		blockFunction = aes.encryptn
+
+	return b"".join(bytes(bytearray(blockFunction(bytearray(data[i:i+16]), expandedKey, AES.engines["BYTE"])))
+					for i in range(0, len(data), 16))
+
+# Conformance check: every available backend must give byte-identical blocks and messages in every mode
+# The reference runs every block through the BYTE engine
+# Each backend runs on its own AES object, so every block of every mode goes through it, the selected backend and the engine of the module are not changed
+# Returns a dictionary of backend name to None when it conforms, otherwise the reason it does not
+def checkBackends(sizes=(0, 1, 15, 16, 17, 1000, 5000)):
+	key = getExpandedKey(bytes(bytearray(range(16))))
+	IVector = bytes(bytearray(range(240, 256)))
+	cases = [(mode, bytes(bytearray(i % 251 for i in range(size)))) for mode in sorted(AES.modes.values()) for size in sizes]
+	# Enough blocks to reach the multi-block engines of the backends
+	blocks = bytes(bytearray(i % 253 for i in range(16 * max(AES.bitsliceMinBlocks, AES.numpyMinBlocks))))
+
+	def encryptCases(aes):
+		ciphers = []
+		for mode, message in cases:
+			out = bytearray(16 * ((len(message) + 15) // 16) + 16)
+			written = aes.encryptInto(message, out, mode, key, IVector)
+			ciphers.append(bytes(out[:written]))
+		return ciphers
+
+	def decryptCases(aes, ciphers):
+		messages = []
+		for (mode, message), cipher in zip(cases, ciphers):
+			out = bytearray(len(cipher))
+			aes.decryptInto(cipher, out, mode, key, IVector)
+			messages.append(bytes(out[:len(message)]))
+		return messages
+
+	referenceAES = AES(AES.engines["BYTE"], Backend("byte", backendByte))
+	reference = encryptCases(referenceAES)
+	referenceBlocks = referenceAES.encryptBlocks(blocks, key)
+
+	results = OrderedDict()
+	for name, backend in backends.items():
+		if(backend.unavailable is not None):
+			results[name] = backend.unavailable
+			continue
+
+		aes = AES(backend=backend)
+		try:
+			ciphers = encryptCases(aes)
+			if(aes.encryptBlocks(blocks, key) != referenceBlocks):
+				results[name] = "its encrypted blocks differ from the reference"
+			elif(aes.decryptBlocks(referenceBlocks, key) != blocks):
+				results[name] = "it does not decrypt the reference blocks"
+			elif(ciphers != reference):
+				results[name] = "its cipher texts differ from the reference"
+			elif(decryptCases(aes, ciphers) != [message for mode, message in cases]):
+				results[name] = "it does not decrypt the cipher texts"
+			else:
+				results[name] = None
+		except Exception as error:
+			results[name] = "it failed: %s" % error
+
+	return results
+
+# Encrypt `input` using `key` AND `key` should be a string of bytes or an ExpandedKey. Returned cipher is a string of bytes prepended with the initialization vector.
+# `input` can be any buffer, the cipher text is written straight into the output buffer
+# IVector - the IVector to use, a new random one by default. GCM keeps its first 12 bytes as the nonce
+# associatedData - GCM only, data authenticated by the tag without being encrypted
+# A GCM cipher is followed by its 16 byte tag
+def encryptMessage(key, input, mode, IVector=None, associatedData=b""):
+	key = getExpandedKey(key)
+	input = memoryview(asBuffer(input))
+	size = len(input)
 
-	keySize = len(key)
 	# Create a new IVector using random input
-	IVector = [ord(i) for i in os.urandom(16)]
+	if(IVector is None):
+		IVector = os.urandom(16)
+	IVector = bytearray(IVector)
+	if(mode == AES.modes["GCM"]):
+		IVector = gcmIVector(IVector)
 	AESmode = AES()
-	(mode, length, ciph) = AESmode.encrypt(input, mode, key, IVector)
+
+	if(mode == AES.modes["CBC"]):
+		# Pad to a multiple of 16-bytes by PKCS7 padding, in the output buffer, then encrypt it in place
+		numpads = 16 - (size%16)
+		out = bytearray(16 + size + numpads)
+		view = memoryview(out)[16:]
+		view[:size] = input
+		view[size:] = bytearray([numpads] * numpads)
+		AESmode.encryptInto(view, view, mode, key, IVector)
+	elif(mode == AES.modes["GCM"]):
+		out = bytearray(16 + size + 16)
+		AESmode.encryptInto(input, memoryview(out)[16:], mode, key, IVector, associatedData)
+	else:
+		out = bytearray(16 + size)
+		AESmode.encryptInto(input, memoryview(out)[16:], mode, key, IVector)
 
 	# With padding, the original length does not need to be known. It's a bad idea to store the original message length. prepend the IVector.
-	return ''.join(map(chr, IVector)) + ''.join(map(chr, ciph))
+	out[:16] = IVector
+
+	return AESmode.convertNumbers(out)
 
-# Decrypt `input` using `key` AND `key` should be a string of bytes. `input` should have the initialization vector prepended as a string of ordinal values.
-def decryptMessage(key, input, mode):
+# Decrypt `input` using `key` AND `key` should be a string of bytes or an ExpandedKey. `input` should have the initialization vector prepended as a string of ordinal values.
+# `input` can be any buffer or a list of characters
+# pool - an optional multiprocessing pool used for CBC and CFB
+# associatedData - GCM only, the data authenticated with the message
+# GCM raises ValueError when the message or the associated data were changed
+def decryptMessage(key, input, mode, pool=None, associatedData=b""):
 
-	key = map(ord, key)
-	keySize = len(key)
+	key = getExpandedKey(key)
+	input = memoryview(asBuffer(input))
 	# IVector is first 16 bytes
-	IVector = map(ord, input[:16])
-	input = map(ord, input[16:])
+	IVector = bytearray(input[:16])
 	AESmode = AES()
-	decr = AESmode.decrypt(input, None, mode, key, IVector)
+
+	# The GCM tag is the last 16 bytes
+	if(mode == AES.modes["GCM"]):
+		# encryptMessage always writes the counter 1 after the nonce
+		if(IVector != gcmIVector(IVector)):
+			raise ValueError("the message failed authentication")
+		out = bytearray(max(0, len(input) - 32))
+		AESmode.decryptInto(input[16:], out, mode, key, IVector, pool, associatedData)
+		return AESmode.convertNumbers(out)
+
+	out = bytearray(len(input) - 16)
+	AESmode.decryptInto(input[16:], out, mode, key, IVector, pool)
 
 	# Return s stripped of PKCS7 padding
 	if(mode == AES.modes["CBC"]):
-		numpads = ord(decr[-1])
-		decr = decr[ : -numpads]
+		numpads = out[-1]
+		del out[-numpads:]
+
+	return AESmode.convertNumbers(out)
+
+# Encrypt every message of `inputs` with `key`, each one has the format of encryptMessage
+# The key is expanded once and every IVector comes from one random read. The CTR keystream of all the messages is generated together
+def encryptMessages(key, inputs, mode):
+	key = getExpandedKey(key)
+	IVectors = os.urandom(16 * len(inputs))
+
+	if(mode == AES.modes["CBC"]):
+		# The CBC chains of the messages advance together
+		IVectors = [IVectors[16*i : 16*i+16] for i in range(len(inputs))]
+		encryptor = MultiCBCEncryptor(key, IVectors)
+		ciphers = encryptor.update(inputs)
+		return [IVectors[i] + cipher + final for i, (cipher, final) in enumerate(zip(ciphers, encryptor.finalize()))]
+
+	if(mode != AES.modes["CTR"]):
+		return [encryptMessage(key, input, mode, IVectors[16*i : 16*i+16]) for i, input in enumerate(inputs)]
+
+	inputs = [memoryview(asBuffer(input)) for input in inputs]
+	keystream = batchCounterKeystream(key, IVectors, [len(input) for input in inputs])
+
+	ciphers = []
+	position = 0
+	for i, input in enumerate(inputs):
+		ciphers.append(IVectors[16*i : 16*i+16] + xorBytes(input.tobytes(), keystream[position : position+len(input)]))
+		position += 16 * ((len(input) + 15) // 16)
+
+	return ciphers
+
+# Decrypt every message of `inputs`, as decryptMessage does for each one
+# The key is expanded once. CTR, CBC and CFB messages do not chain between blocks, so the block cipher work of all the messages is done together
+def decryptMessages(key, inputs, mode):
+	key = getExpandedKey(key)
+
+	if(mode not in (AES.modes["CTR"], AES.modes["CBC"], AES.modes["CFB"])):
+		return [decryptMessage(key, input, mode) for input in inputs]
+
+	inputs = [memoryview(asBuffer(input)) for input in inputs]
+	IVectors = [input[:16].tobytes() for input in inputs]
+	bodies = [input[16:].tobytes() for input in inputs]
+	aes = AES()
+
+	if(mode == AES.modes["CTR"]):
+		keystream = batchCounterKeystream(key, b"".join(IVectors), [len(body) for body in bodies])
+	elif(mode == AES.modes["CBC"]):
+		# Every cipher block is decrypted, then XORed with the cipher block before it
+		keystream = aes.decryptBlocks(b"".join(bodies), key)
+	else:
+		# Every cipher block is XORed with the encryption of the cipher block before it
+		inputBlocks = [(IVectors[i] + body)[: 16 * ((len(body) + 15) // 16)] for i, body in enumerate(bodies)]
+		keystream = aes.encryptBlocks(b"".join(inputBlocks), key)
+
+	plainTexts = []
+	position = 0
+	for i, body in enumerate(bodies):
+		blocks = keystream[position : position+len(body)]
+		position += 16 * ((len(body) + 15) // 16)
+
+		if(mode == AES.modes["CBC"]):
+			decr = xorBytes(blocks, IVectors[i] + body[:-16])
+			# Return s stripped of PKCS7 padding
+			decr = decr[ : -ord(decr[-1])]
+		else:
+			decr = xorBytes(body, blocks)
+		plainTexts.append(decr)
+
+	return plainTexts
+
+# The CTR keystream of several messages, generated by one call to the block engine
+# IVectors - the IVectors of the messages, one after the other
+# sizes - the sizes of the messages, the keystream of each one is rounded up to whole blocks
+def batchCounterKeystream(key, IVectors, sizes):
+	aes = AES()
+	counters = [aes.counterBlocks(IVectors[16*i : 16*i+16], 0, (size + 15) // 16) for i, size in enumerate(sizes)]
+
+	return aes.encryptBlocks(b"".join(counters), key)
+
+# CBC encryption of K independent streams in lockstep
+# A CBC chain cannot be split, but the chains of different streams do not depend on each other,
+# so every step takes the next block of each stream and encrypts the K blocks together with the multi-block engine
+class MultiCBCEncryptor(object):
+
+	# IVectors - one IVector for each stream
+	def __init__(self, key, IVectors):
+		self.aes = AES()
+		self.key = getExpandedKey(key)
+		# The previous cipher block of each stream
+		self.chains = [bytes(bytearray(IVector)) for IVector in IVectors]
+		# Bytes of each stream waiting for a complete block
+		self.buffers = [bytearray() for IVector in IVectors]
+		self.finalized = False
+
+	# Encrypts the complete blocks of every stream
+	# pieces - the next piece of each stream, in the order of the IVectors
+	# Returns the cipher text of each stream produced so far
+	def update(self, pieces):
+		if(self.finalized == True):
+			raise ValueError("the streams are already finalized")
+
+		streams = []
+		for buffer, piece in zip(self.buffers, pieces):
+			buffer += bytearray(memoryview(asBuffer(piece)).tobytes())
+			size = len(buffer) // 16 * 16
+			streams.append(bytes(buffer[:size]))
+			del buffer[:size]
+
+		return self.encryptLockstep(streams)
+
+	# Pads every stream with PKCS7 padding and encrypts its last blocks
+	def finalize(self):
+		if(self.finalized == True):
+			raise ValueError("the streams are already finalized")
+		self.finalized = True
+
+		streams = []
+		for buffer in self.buffers:
+			numpads = 16 - len(buffer)
+			streams.append(bytes(buffer + bytearray([numpads] * numpads)))
+
+		return self.encryptLockstep(streams)
+
+	# Encrypts streams of complete blocks, one block of every stream at each step
+	def encryptLockstep(self, streams):
+		outs = [bytearray(len(stream)) for stream in streams]
+		# The longest streams first, so the streams still running at a step are always the first ones
+		order = sorted(range(len(streams)), key=lambda i: -len(streams[i]))
+		active = len(order)
+
+		for position in range(0, max([0] + [len(stream) for stream in streams]), 16):
+			while(len(streams[order[active - 1]]) <= position):
+				active -= 1
+			running = order[:active]
+
+			plainBlocks = b"".join([streams[i][position : position+16] for i in running])
+			chainBlocks = b"".join([self.chains[i] for i in running])
+			cipherBlocks = self.aes.encryptBlocks(xorBytes(plainBlocks, chainBlocks), self.key)
+
+			for n, i in enumerate(running):
+				block = cipherBlocks[16*n : 16*n+16]
+				self.chains[i] = block
+				outs[i][position : position+16] = block
+
+		return [bytes(out) for out in outs]
+
+# Builds the GHASH multiplication tables of the hash key H, a 128 bit number
+# tables[i][b] is the GF(2^128) product of H and the block whose byte i is b and other bytes are 0,
+# so the product of H and any block is the XOR of 16 table entries
+def buildGHashTables(H):
+	# powers[k] is the product of H and the block with only bit k set, bit 0 being the top bit
+	powers = []
+	for k in range(128):
+		powers.append(H)
+		if(H & 1):
+			H = (H >> 1) ^ (0xE1 << 120)
+		else:
+			H >>= 1
+
+	tables = []
+	for i in range(16):
+		table = [0] * 256
+		for b in range(1, 256):
+			low = b & -b
+			table[b] = table[b ^ low] ^ powers[8*i + 8 - low.bit_length()]
+		tables.append(table)
+
+	return tables
+
+# The GHASH tables of the last keys used, keyed by the key bytes
+# The tables of a key take about 236 KB, so they are kept for fewer keys than the expanded keys of keyCache
+ghashTablesCache = OrderedDict()
+ghashTablesLock = threading.Lock()
+ghashTablesMaxKeys = 8
+
+# Returns the GHASH tables of a key, the hash key H is the encryption of the zero block
+def getGHashTables(key):
+	key = getExpandedKey(key)
+
+	with ghashTablesLock:
+		tables = ghashTablesCache.pop(key.key, None)
+		if(tables is not None):
+			ghashTablesCache[key.key] = tables
+			return tables
+
+	H = int(binascii.hexlify(AES().encryptBlocks(b"\0" * 16, key)), 16)
+	tables = buildGHashTables(H)
+
+	with ghashTablesLock:
+		ghashTablesCache[key.key] = tables
+		while(len(ghashTablesCache) > ghashTablesMaxKeys):
+			ghashTablesCache.popitem(False)
+
+	return tables
+
+# The first counter block of GCM: the first 12 bytes of the IVector are the nonce, the last 4 bytes are the counter 1
+def gcmIVector(IVector):
+	return bytearray(IVector)[:12] + bytearray(b"\0\0\0\1")
+
+# Incremental GHASH of the associated data and the cipher text of a GCM message
+class GHash(object):
+
+	def __init__(self, key, associatedData=b""):
+		self.tables = getGHashTables(key)
+		self.value = 0
+		# Cipher text waiting for a complete block
+		self.buffer = bytearray()
+		self.associatedSize = len(associatedData)
+		self.size = 0
+
+		self.blocks(self.padded(bytearray(associatedData)))
+
+	# Pads the data with zeros to whole blocks
+	def padded(self, data):
+		return data + bytearray(-len(data) % 16)
+
+	# Hashes whole blocks: every block is XORed into the value, which is then multiplied by H
+	def blocks(self, data):
+		T0, T1, T2, T3, T4, T5, T6, T7, T8, T9, T10, T11, T12, T13, T14, T15 = self.tables
+		words = struct.unpack(">%dQ" % (len(data) // 8), bytes(data))
+		x = self.value
+
+		for i in range(0, len(words), 2):
+			x ^= words[i] << 64 | words[i+1]
+			x = (T0[x >> 120] ^ T1[(x >> 112) & 0xFF] ^ T2[(x >> 104) & 0xFF] ^ T3[(x >> 96) & 0xFF] ^
+				 T4[(x >> 88) & 0xFF] ^ T5[(x >> 80) & 0xFF] ^ T6[(x >> 72) & 0xFF] ^ T7[(x >> 64) & 0xFF] ^
+				 T8[(x >> 56) & 0xFF] ^ T9[(x >> 48) & 0xFF] ^ T10[(x >> 40) & 0xFF] ^ T11[(x >> 32) & 0xFF] ^
+				 T12[(x >> 24) & 0xFF] ^ T13[(x >> 16) & 0xFF] ^ T14[(x >> 8) & 0xFF] ^ T15[x & 0xFF])
+
+		self.value = x
+
+	# Hashes the next cipher text
+	def update(self, data):
+		self.buffer += bytearray(data)
+		self.size += len(data)
+
+		size = len(self.buffer) // 16 * 16
+		self.blocks(self.buffer[:size])
+		del self.buffer[:size]
+
+	# Returns the 16 byte GHASH, after the last partial block and the bit lengths of the associated data and the cipher text
+	def digest(self):
+		x = self.value
+		self.blocks(self.padded(self.buffer) + struct.pack(">QQ", 8 * self.associatedSize, 8 * self.size))
+		x, self.value = self.value, x
+
+		return struct.pack(">QQ", x >> 64, x & 0xFFFFFFFFFFFFFFFF)
+
+# Incremental encryption and decryption of a message that arrives in pieces. Only a partial block is buffered between updates
+# The chaining state of the mode is carried from one update to the next
+class MessageStream(object):
+
+	# associatedData - the data authenticated with a GCM message without being encrypted
+	def __init__(self, key, mode, associatedData=b""):
+		self.aes = AES()
+		self.key = getExpandedKey(key)
+		self.mode = mode
+		# The GHASH of the cipher text in GCM mode
+		self.ghash = None
+		if(mode == AES.modes["GCM"]):
+			self.ghash = GHash(self.key, associatedData)
+		# Bytes waiting for a complete block
+		self.buffer = bytearray()
+		# The previous cipher block for CFB and CBC, the previous output block for OFB
+		self.feedback = None
+		# Number of CTR blocks already used
+		self.counter = 0
+		self.IVector = None
+		self.finalized = False
+
+	# Sets the IVector of the message
+	# In GCM the IVector is the first counter block, it encrypts the tag and the message starts at the next counter
+	# Only the nonce of a GCM IVector is kept, with the counter 1
+	def setIVector(self, IVector):
+		if(self.mode == AES.modes["GCM"]):
+			IVector = gcmIVector(IVector)
+			self.counter = 1
+
+		self.IVector = bytearray(IVector)
+		self.feedback = bytearray(IVector)
+
+	# Encrypts one block with the key
+	def encryptBlock(self, block):
+		return bytearray(self.aes.encryptn(block, self.key))
+
+	# Returns the next keystream block of the CFB, OFB, CTR and GCM modes
+	def keystreamBlock(self):
+		if(self.mode in (AES.modes["CTR"], AES.modes["GCM"])):
+			return bytearray(self.aes.counterKeystream(self.key, self.IVector, self.counter, 1))
+
+		return self.encryptBlock(self.feedback)
+
+	# XOR the keystream of the CFB, OFB, CTR or GCM mode with complete blocks
+	# cipherFeedback - the cipher blocks to feed back in CFB mode
+	def keystreamBlocks(self, blocks, cipherFeedback):
+		if(self.mode in (AES.modes["CTR"], AES.modes["GCM"])):
+			count = len(blocks) // 16
+			# The GCM counter only has 32 bits
+			if(self.mode == AES.modes["GCM"] and self.counter + count >= 1 << 32):
+				raise ValueError("a GCM message is limited to 2^32 - 2 blocks")
+			keystream = self.aes.counterKeystream(self.key, self.IVector, self.counter, count)
+			self.counter += count
+			return xorBytes(blocks, keystream)
+
+		out = bytearray(len(blocks))
+		for i in range(0, len(blocks), 16):
+			keystream = self.encryptBlock(self.feedback)
+			block = bytearray(xorBytes(blocks[i:i+16], keystream))
+			out[i:i+16] = block
+
+			if(self.mode == AES.modes["OFB"]):
+				self.feedback = keystream
+			elif(cipherFeedback == True):
+				self.feedback = block
+			else:
+				self.feedback = blocks[i:i+16]
+
+		return bytes(out)
+
+	# Takes the complete blocks out of the buffer, keeping `keep` bytes back
+	def takeBlocks(self, keep):
+		size = max(0, len(self.buffer) - keep) // 16 * 16
+		blocks = self.buffer[:size]
+		del self.buffer[:size]
+
+		return blocks
+
+	# XOR the remaining partial block with one more keystream block
+	def finalizePartial(self):
+		out = xorBytes(self.buffer, self.keystreamBlock())
+		del self.buffer[:]
 
-	return decr
+		return out
+
+	# The GCM tag: the GHASH of the message XOR the encryption of the first counter block
+	def tag(self):
+		return xorBytes(self.ghash.digest(), self.aes.counterKeystream(self.key, self.IVector, 0, 1))
+
+	# Updates are refused once the message is finalized
+	def checkOpen(self):
+		if(self.finalized == True):
+			raise ValueError("the message is already finalized")
+
+# Incremental encryption. The output has the same format as encryptMessage: the IVector followed by the cipher text
+class MessageEncryptor(MessageStream):
+
+	def __init__(self, key, mode, IVector=None, associatedData=b""):
+		MessageStream.__init__(self, key, mode, associatedData)
+
+		# Create a new IVector using random input
+		if(IVector is None):
+			IVector = os.urandom(16)
+
+		self.setIVector(IVector)
+		# The IVector is written before the first cipher text
+		self.header = bytes(self.IVector)
+
+	# Encrypts the complete blocks of `data` and returns the cipher text produced so far
+	def update(self, data):
+		self.checkOpen()
+		self.buffer += bytearray(asBuffer(data))
+		blocks = self.takeBlocks(0)
+
+		if(self.mode == AES.modes["CBC"]):
+			out = self.chainBlocks(blocks)
+		else:
+			out = self.keystreamBlocks(blocks, True)
+
+		if(self.ghash is not None):
+			self.ghash.update(out)
+
+		out = self.header + out
+		self.header = b""
+
+		return out
+
+	# CBC encryption of complete blocks
+	def chainBlocks(self, blocks):
+		out = bytearray(len(blocks))
+
+		for i in range(0, len(blocks), 16):
+			self.feedback = self.encryptBlock(bytearray(xorBytes(blocks[i:i+16], self.feedback)))
+			out[i:i+16] = self.feedback
+
+		return bytes(out)
+
+	# Encrypts the rest of the message. CBC adds the PKCS7 padding, GCM adds the tag
+	def finalize(self):
+		self.checkOpen()
+		self.finalized = True
+
+		if(self.mode == AES.modes["CBC"]):
+			numpads = 16 - len(self.buffer)
+			self.buffer += bytearray([numpads] * numpads)
+			out = self.chainBlocks(self.takeBlocks(0))
+		elif(self.mode == AES.modes["GCM"]):
+			out = self.finalizePartial() if len(self.buffer) else b""
+			self.ghash.update(out)
+			out += self.tag()
+		else:
+			out = self.finalizePartial()
+
+		return self.header + out
+
+# Incremental decryption of the output of encryptMessage or MessageEncryptor. The IVector is read from the first 16 bytes
+class MessageDecryptor(MessageStream):
+
+	def __init__(self, key, mode, associatedData=b""):
+		MessageStream.__init__(self, key, mode, associatedData)
+		# A GCM header that does not end with the counter 1 was changed, the message then fails authentication
+		self.headerChanged = False
+
+	# Decrypts the complete blocks of `data` and returns the plain text produced so far
+	def update(self, data):
+		self.checkOpen()
+		self.buffer += bytearray(asBuffer(data))
+
+		if(self.IVector is None):
+			if(len(self.buffer) < 16):
+				return b""
+			if(self.mode == AES.modes["GCM"]):
+				self.headerChanged = (self.buffer[:16] != gcmIVector(self.buffer[:16]))
+			self.setIVector(self.buffer[:16])
+			del self.buffer[:16]
+
+		if(self.mode == AES.modes["CBC"]):
+			# The last block holds the padding, it is kept until finalize
+			return self.chainBlocks(self.takeBlocks(1))
+
+		if(self.mode == AES.modes["GCM"]):
+			# The last 16 bytes are the tag, they are kept until finalize
+			# The plain text given before finalize is only authentic once finalize returns
+			blocks = self.takeBlocks(16)
+			self.ghash.update(blocks)
+			return self.keystreamBlocks(blocks, False)
+
+		if(self.mode == AES.modes["CFB"]):
+			return self.chainBlocks(self.takeBlocks(0))
+
+		return self.keystreamBlocks(self.takeBlocks(0), False)
+
+	# CBC and CFB decryption of complete blocks, decrypted together
+	def chainBlocks(self, blocks):
+		if(len(blocks) == 0):
+			return b""
+
+		out = self.aes.decryptChunkBlocks(self.key, self.mode, bytes(self.feedback), bytes(blocks))
+		self.feedback = blocks[-16:]
+
+		return out
+
+	# Decrypts the rest of the message. CBC strips the PKCS7 padding
+	# GCM raises ValueError when the tag does not match the message
+	def finalize(self):
+		self.checkOpen()
+		self.finalized = True
+
+		if(self.mode == AES.modes["GCM"]):
+			if(self.IVector is None or len(self.buffer) < 16):
+				raise ValueError("the message is shorter than the GCM tag")
+
+			tag = bytes(self.buffer[-16:])
+			del self.buffer[-16:]
+			self.ghash.update(self.buffer)
+			out = self.finalizePartial() if len(self.buffer) else b""
+
+			if(not hmac.compare_digest(self.tag(), tag) or self.headerChanged):
+				raise ValueError("the message failed authentication")
+
+			return out
+
+		if(self.IVector is None):
+			return b""
+
+		if(self.mode == AES.modes["CBC"]):
+			decr = self.chainBlocks(self.takeBlocks(0))
+			numpads = ord(decr[-1])
+			return decr[ : -numpads]
+
+		return self.finalizePartial()
+
+# Encrypt everything read from `reader` and write it to `writer` in pieces of `chunkSize` bytes, with the format of encryptMessage
+def encryptStream(key, reader, writer, mode, chunkSize=65536, IVector=None):
+	encryptor = MessageEncryptor(key, mode, IVector)
+
+	while(True):
+		chunk = reader.read(chunkSize)
+		if(not chunk):
+			break
+		writer.write(encryptor.update(chunk))
+
+	writer.write(encryptor.finalize())
+
+# Decrypt everything read from `reader` and write it to `writer` in pieces of `chunkSize` bytes
+def decryptStream(key, reader, writer, mode, chunkSize=65536):
+	decryptor = MessageDecryptor(key, mode)
+
+	while(True):
+		chunk = reader.read(chunkSize)
+		if(not chunk):
+			break
+		writer.write(decryptor.update(chunk))
+
+	writer.write(decryptor.finalize())
+
+# OFB keystream generated ahead of time. The keystream only depends on the key and the IVector,
+# so a background thread fills a bounded buffer with it before the message is known. Encrypting or decrypting is then a XOR with the buffered keystream
+# The thread stops on close(), at the end of a with block, once `length` bytes were generated, or when the object is dropped
+# bufferSize - the most keystream bytes generated ahead
+# chunkSize - the keystream bytes generated at a time, rounded to whole blocks
+# length - the most keystream bytes that will be read, None for no limit
+class OFBKeystream(object):
+
+	def __init__(self, key, IVector=None, bufferSize=1 << 20, chunkSize=1 << 14, length=None):
+		self.stop = threading.Event()
+
+		# Create a new IVector using random input
+		if(IVector is None):
+			IVector = os.urandom(16)
+
+		self.key = getExpandedKey(key)
+		self.IVector = bytes(bytearray(IVector))
+		self.chunkBlocks = max(1, chunkSize // 16)
+		# Ring of generated keystream chunks, the thread waits while it is full
+		self.chunks = Queue.Queue(max(1, bufferSize // (16 * self.chunkBlocks)))
+		# Keystream taken from the ring but not used yet
+		self.pending = bytearray()
+		# Keystream bytes that can still be read, None for no limit
+		self.remaining = length
+		self.closed = False
+
+		# The thread only holds a weak reference to the object, so dropping the object stops it
+		self.thread = threading.Thread(target=generateOFBKeystream, args=(weakref.ref(self), self.key, list(bytearray(IVector)),
+																		  self.chunkBlocks, length, self.chunks, self.stop))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception):
+		self.close()
+
+	def __del__(self):
+		self.stop.set()
+
+	# Returns the next `size` bytes of keystream
+	def read(self, size):
+		if(self.closed == True):
+			raise ValueError("the keystream is closed")
+
+		if(self.remaining is not None):
+			if(size > self.remaining):
+				raise ValueError("the keystream has only %d bytes left" % self.remaining)
+			self.remaining -= size
+
+		while(len(self.pending) < size):
+			self.pending += self.chunks.get()
+
+		keystream = bytes(self.pending[:size])
+		del self.pending[:size]
+
+		# The whole keystream was read, the thread has nothing left to do
+		if(self.remaining == 0):
+			self.close()
+
+		return keystream
+
+	# XOR `data` with the next bytes of keystream. The output continues the OFB cipher text of the previous calls,
+	# so the IVector followed by xor(message) is what encryptMessage returns for OFB
+	def xor(self, data):
+		data = bytearray(asBuffer(data))
+
+		return xorBytes(data, self.read(len(data)))
+
+	# Stops the background thread
+	def close(self):
+		self.closed = True
+		self.stop.set()
+		self.thread.join()
+
+# Body of the thread of an OFBKeystream, each block is the encryption of the previous one
+# owner - a weak reference to the OFBKeystream, the thread stops when it is dropped
+def generateOFBKeystream(owner, key, block, chunkBlocks, length, chunks, stop):
+	aes = AES()
+	words = key.encWords
+	nbrRounds = key.nbrRounds
+	generated = 0
+
+	while(not stop.is_set() and (length is None or generated < length)):
+		chunk = bytearray(16 * chunkBlocks)
+		for i in range(0, len(chunk), 16):
+			block = aes.AESTable(block, words, nbrRounds)
+			chunk[i:i+16] = bytearray(block)
+		generated += len(chunk)
+
+		while(not stop.is_set() and owner() is not None):
+			try:
+				chunks.put(bytes(chunk), timeout=0.1)
+				break
+			except Queue.Full:
+				pass
+		else:
+			return
+
+# Processes one segment of a file for encryptFile and decryptFile, in a worker process
+# Both files are memory-mapped by the worker, so the segment is never sent through the pool and the result is written straight into the output file
+# task - (key, mode, IVector, inFilename, inOffset, outFilename, outOffset, start, length) where start and length are in bytes of the message
+def fileSegment(task):
+	key, mode, IVector, inFilename, inOffset, outFilename, outOffset, start, length = task
+	aes = AES()
+	chunkSize = 16 * aes.chunkBlocks
+
+	inFile = open(inFilename, "rb")
+	outFile = open(outFilename, "r+b")
+	inMap = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+	outMap = mmap.mmap(outFile.fileno(), 0, access=mmap.ACCESS_WRITE)
+
+	try:
+		for position in range(start, start + length, chunkSize):
+			end = min(position + chunkSize, start + length)
+			chunk = inMap[inOffset + position : inOffset + end]
+
+			if(mode == AES.modes["CTR"]):
+				keystream = aes.counterKeystream(key, IVector, position // 16, (len(chunk) + 15) // 16)
+				result = xorBytes(chunk, keystream)
+			else:
+				# CBC and CFB decryption, the cipher block before the chunk is read from the input
+				if(position == 0):
+					previous = bytes(bytearray(IVector))
+				else:
+					previous = inMap[inOffset + position - 16 : inOffset + position]
+				result = aes.decryptChunkBlocks(key, mode, previous, chunk)
+
+			outMap[outOffset + position : outOffset + position + len(result)] = result
+	finally:
+		outMap.close()
+		inMap.close()
+		outFile.close()
+		inFile.close()
+
+# Runs fileSegment over segments of `length` bytes of the message in a pool of `jobs` processes
+def processFileSegments(key, mode, IVector, inFilename, inOffset, outFilename, outOffset, length, jobs, segmentSize):
+	segmentSize = max(16, segmentSize // 16 * 16)
+	tasks = [(key.key, mode, bytes(bytearray(IVector)), inFilename, inOffset, outFilename, outOffset, start, min(segmentSize, length - start))
+			 for start in range(0, length, segmentSize)]
+
+	pool = multiprocessing.Pool(jobs)
+	try:
+		pool.map(fileSegment, tasks)
+	finally:
+		pool.close()
+		pool.join()
+
+# Encrypt the file `inFilename` into `outFilename`, with the format of encryptMessage
+# CTR keystream blocks are independent, so CTR files are split into segments of segmentSize bytes encrypted by `jobs` processes
+# The other modes chain every block to the previous cipher block and are encrypted by encryptStream
+def encryptFile(key, inFilename, outFilename, mode, jobs=None, segmentSize=1 << 23):
+	key = getExpandedKey(key)
+	size = os.path.getsize(inFilename)
+
+	if(mode != AES.modes["CTR"] or size == 0):
+		inFile = open(inFilename, "rb")
+		outFile = open(outFilename, "wb")
+		try:
+			encryptStream(key, inFile, outFile, mode)
+		finally:
+			outFile.close()
+			inFile.close()
+		return
+
+	# Create a new IVector using random input
+	IVector = os.urandom(16)
+	outFile = open(outFilename, "wb")
+	outFile.write(IVector)
+	outFile.truncate(16 + size)
+	outFile.close()
+
+	processFileSegments(key, mode, IVector, inFilename, 0, outFilename, 16, size, jobs, segmentSize)
+
+# Decrypt the file `inFilename`, written by encryptFile or encryptMessage, into `outFilename`
+# CTR, CBC and CFB decryption do not chain, so those files are split into segments of segmentSize bytes decrypted by `jobs` processes
+# OFB and GCM are decrypted by decryptStream, a GCM file that fails authentication raises ValueError
+def decryptFile(key, inFilename, outFilename, mode, jobs=None, segmentSize=1 << 23):
+	key = getExpandedKey(key)
+	size = os.path.getsize(inFilename) - 16
+
+	if(mode not in (AES.modes["CTR"], AES.modes["CBC"], AES.modes["CFB"]) or size <= 0):
+		inFile = open(inFilename, "rb")
+		outFile = open(outFilename, "wb")
+		try:
+			decryptStream(key, inFile, outFile, mode)
+		except ValueError:
+			# A GCM file that fails authentication leaves no plain text behind
+			outFile.close()
+			os.remove(outFilename)
+			raise
+		finally:
+			outFile.close()
+			inFile.close()
+		return
+
+	inFile = open(inFilename, "rb")
+	IVector = inFile.read(16)
+	inFile.close()
+
+	outFile = open(outFilename, "wb")
+	outFile.truncate(size)
+	outFile.close()
+
+	processFileSegments(key, mode, IVector, inFilename, 16, outFilename, 0, size, jobs, segmentSize)
+
+	# Strip the PKCS7 padding
+	if(mode == AES.modes["CBC"]):
+		outFile = open(outFilename, "r+b")
+		outFile.seek(-1, 2)
+		numpads = ord(outFile.read(1))
+		outFile.truncate(size - numpads)
+		outFile.close()
+
+# Opt-in instrumentation of the hot paths
+# When it is enabled the functions below are replaced by wrappers that count and time their calls, and disabling puts the originals back,
+# so the disabled paths cost nothing
+# Stages: keySchedule (ExpandedKey), rounds (encryptn, decryptn, processBlocks), modeXor (xorBytes, xorBlock),
+# conversion (convertBytes, convertNumbers) and message (encryptMessage, decryptMessage)
+class Instrumentation(object):
+
+	stages = ("keySchedule", "rounds", "modeXor", "conversion", "message")
+
+	# callback - an optional function called as callback(stage, seconds, counter, amount) for every measured call
+	def __init__(self, callback=None):
+		self.callback = callback
+		self.lock = threading.Lock()
+		self.reset()
+
+	# Sets every counter and timer to zero
+	def reset(self):
+		self.counters = dict(blocks=0, keyExpansions=0, bytesConverted=0, messageBytes=0)
+		self.seconds = dict((stage, 0.0) for stage in self.stages)
+		self.calls = dict((stage, 0) for stage in self.stages)
+
+	# Adds one measured call
+	def record(self, stage, seconds, counter, amount):
+		with self.lock:
+			self.seconds[stage] += seconds
+			self.calls[stage] += 1
+			if(counter is not None):
+				self.counters[counter] += amount
+
+		if(self.callback is not None):
+			self.callback(stage, seconds, counter, amount)
+
+	# Returns a copy of the counters and timers
+	def snapshot(self):
+		with self.lock:
+			return dict(counters=dict(self.counters), seconds=dict(self.seconds), calls=dict(self.calls))
+
+# The enabled Instrumentation, None when it is disabled
+instrumentation = None
+
+# The functions replaced by the instrumentation wrappers, to put them back
+instrumentedOriginals = []
+
+# Returns a wrapper of `function` that records its time under `stage`
+# amount - a function of the arguments giving how much to add to `counter`
+def instrumented(function, stage, counter=None, amount=None):
+	def wrapper(*args, **kwargs):
+		start = time.time()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			# Calls that raise are timed too
+			seconds = time.time() - start
+			if(instrumentation is not None):
+				instrumentation.record(stage, seconds, counter, amount(*args, **kwargs) if amount is not None else 0)
+
+	return wrapper
+
+# Number of blocks in the argument of processBlocks
+def countBlocks(aes, blocks, *args, **kwargs):
+	if(numpy is not None and isinstance(blocks, numpy.ndarray)):
+		return blocks.size // 16
+
+	return len(memoryview(blocks)) // 16
+
+# Enables the instrumentation and returns it. It is enabled once, later calls return the same object
+def enableInstrumentation(callback=None):
+	global instrumentation
+
+	if(instrumentation is not None):
+		return instrumentation
+
+	instrumentation = Instrumentation(callback)
+	module = globals()
+
+	# (owner, name, stage, counter, amount)
+	targets = [
+		(ExpandedKey, "__init__", "keySchedule", "keyExpansions", lambda *args, **kwargs: 1),
+		(AES, "encryptn", "rounds", "blocks", lambda *args, **kwargs: 1),
+		(AES, "decryptn", "rounds", "blocks", lambda *args, **kwargs: 1),
+		(AES, "processBlocks", "rounds", "blocks", countBlocks),
+		(AES, "convertBytes", "conversion", "bytesConverted", lambda aes, string, *args, **kwargs: len(string)),
+		(AES, "convertNumbers", "conversion", "bytesConverted", lambda aes, numbers, *args, **kwargs: len(numbers)),
+		(module, "xorBytes", "modeXor", None, None),
+		(module, "xorBlock", "modeXor", None, None),
+		(module, "encryptMessage", "message", "messageBytes", lambda key, input, *args, **kwargs: len(input)),
+		(module, "decryptMessage", "message", "messageBytes", lambda key, input, *args, **kwargs: len(input))]
+
+	for owner, name, stage, counter, amount in targets:
+		if(owner is module):
+			original = module[name]
+			module[name] = instrumented(original, stage, counter, amount)
+		else:
+			original = owner.__dict__[name]
+			setattr(owner, name, instrumented(original, stage, counter, amount))
+		instrumentedOriginals.append((owner, name, original))
+
+	return instrumentation
+
+# Disables the instrumentation and returns its last snapshot, None when it was not enabled
+def disableInstrumentation():
+	global instrumentation
+
+	if(instrumentation is None):
+		return None
+
+	module = globals()
+	for owner, name, original in instrumentedOriginals:
+		if(owner is module):
+			module[name] = original
+		else:
+			setattr(owner, name, original)
+	del instrumentedOriginals[:]
+
+	snapshot = instrumentation.snapshot()
+	instrumentation = None
+
+	return snapshot
 
 if __name__ == "__main__":
+	# python part_a_b.py --backends reports the backends and checks that they give the same output
+	if(len(sys.argv) > 1 and sys.argv[1] == "--backends"):
+		print "Selected backend:", backendName()
+		results = checkBackends()
+		for name, problem in results.items():
+			print "%-10s %s" % (name, "ok" if problem is None else problem)
+		sys.exit(1 if any(problem is not None and backends[name].unavailable is None for name, problem in results.items()) else 0)
+
 	print "---------- PART A: AES Sifreleme / Desifreleme ----------\n"
 	modeName = "CFB"
 	cleartext = "Bu bir acik metin test mesajidir. Merhaba Dunya!"
@@ -622,5 +2438,20 @@ if __name__ == "__main__":
 	cipher = encryptMessage(key, cleartext, mode)
 	print "Sifreli Metin:", [ord(x) for x in cipher], "\n"
 
+	decr = decryptMessage(key, cipher, mode)
+	print "Desifrelenmis Metin:", decr, "\n"
+
+	modeName = "GCM"
+	print "----- 3. Mod: " + modeName + " -----\n"
+	cleartext = "Bu bir GCM modu acik metin test mesajidir. Merhaba Dunya!"
+	print "Acik Metin: \"" + cleartext + "\"\n"
+
+	key = generateRandomKey()
+	print "Anahtar:", [ord(x) for x in key], "\n"
+
+	mode = AES.modes[modeName]
+	cipher = encryptMessage(key, cleartext, mode)
+	print "Sifreli Metin ve Etiket:", [ord(x) for x in cipher], "\n"
+
 	decr = decryptMessage(key, cipher, mode)
 	print "Desifrelenmis Metin:", decr, "\n"
\ No newline at end of file
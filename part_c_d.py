@@ -2,48 +2,270 @@
 # -*- coding: UTF-8 -*-
 
 import part_a_b as aesmodule
+import binascii
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
 import sys
+import time
 
 mode = aesmodule.AES.modes["CFB"]
 
+# Size of the encrypted hash appended to a file: the IVector and the 16 byte encrypted hash
+trailerSize = 32
+
+# Messages up to this size are folded directly, larger ones are first folded down to this size as they are hashed
+hashWindowSize = 1 << 16
+
+# Size of the pieces read from a file or a mapped region
+chunkSize = 1 << 20
+
+# The chunked integrity record of a file is kept next to it, in a file with this suffix
+recordSuffix = ".chunks"
+recordMagic = "HCHK"
+
 # Hash message
 # First expand to the nearest multiplies of 16
 # XOR Left and Rİght sides
 # Continiue, until 16 values remains.
 def hash(message):
+	hashObject = Hash(len(message))
+	hashObject.update(message)
+
+	return hashObject.digest()
+
+# The pad and fold loop of hash() on a whole message. Each fold XORs the two halves as numbers, so every level is linear
+def foldMessage(message):
 	while(len(message) != 16):
 		size = len(message)
 		expsize = 16 - (size % 16)
+		message += hashPadding(expsize)
 
-		i = 0
-		char = 'a'
-		while i < expsize:
-			message += char
-			char = chr(ord(char) + 1)
-			i += 1
-
-		newSize = len(message)
-		messageLeft = message[ : newSize//2]
-		messageRight = message[newSize//2 : ]
-		message = [chr(ord(a) ^ ord(b)) for a,b in zip(messageLeft,messageRight)]
-		message = listToString(message)
+		half = len(message) // 2
+		message = numberToBytes(bytesToNumber(message[ : half]) ^ bytesToNumber(message[half : ]), half)
 
 	return message
 
+# The `size` padding characters 'a', 'b', ... of one level
+def hashPadding(size):
+	return "".join([chr(ord('a') + i) for i in range(size)])
+
+# The levels of hash() for a message of `size` bytes
+# At every level the message of `size` bytes is padded to 2*half bytes and folded to half bytes, until 16 bytes remain
+def hashLevels(size):
+	levels = []
+
+	while(size != 16):
+		half = (size // 16 + 1) * 8
+		levels.append((size, half))
+		size = half
+
+	return levels
+
+# Read a string of bytes as a little-endian number
+def bytesToNumber(piece):
+	if(len(piece) == 0):
+		return 0
+
+	return int(binascii.hexlify(piece[::-1]), 16)
+
+# Write a number as a little-endian string of `size` bytes
+def numberToBytes(number, size):
+	return binascii.unhexlify("%0*x" % (2*size, number))[::-1]
+
+# hashlib style hash object with the same digest as hash()
+# Every byte is XORed into the position it reaches after all the folds, so the data is hashed as it arrives in O(n) time
+# and only a window of hashWindowSize bytes is kept. The remaining folds of that window are done by foldMessage
+# The positions depend on the message size: with `size` the memory stays O(1), without it the data is kept until digest()
+# start - the position of the first piece, to hash one segment of the message. Hash objects of segments are joined by combine()
+class Hash(object):
+
+	def __init__(self, size=None, start=0):
+		self.size = size
+		# Position of the next piece
+		self.position = start
+		# Number of bytes hashed so far
+		self.count = 0
+
+		if(size is None):
+			self.data = []
+			return
+
+		# hash() never ends for those messages, the padding and the fold keep the size under 16
+		if(size < 16):
+			raise ValueError("a message shorter than 16 bytes cannot be hashed")
+
+		self.levels = hashLevels(size)
+
+		# The first level whose message fits in the window
+		self.windowLevel = 0
+		while(self.windowLevel < len(self.levels) and self.levels[self.windowLevel][0] > hashWindowSize):
+			self.windowLevel += 1
+
+		if(self.windowLevel == len(self.levels)):
+			self.windowSize = 16
+		else:
+			self.windowSize = self.levels[self.windowLevel][0]
+		self.window = 0
+
+	# Hash the next piece of the message
+	def update(self, piece):
+		piece = memoryview(aesmodule.asBuffer(piece)).tobytes()
+
+		if(self.size is None):
+			self.data.append(piece)
+		else:
+			if(self.position + len(piece) > self.size):
+				raise ValueError("more data than the size of the message")
+			self.window = self.fold(self.window, 0, self.position, piece)
+
+		self.position += len(piece)
+		self.count += len(piece)
+
+	# Adds the segments hashed by another hash object of the same message size
+	def combine(self, other):
+		self.window ^= other.window
+		self.count += other.count
+
+	# XOR a piece found at `position` of the message of `level` into the window, folding it through the levels above the window
+	def fold(self, window, level, position, piece):
+		pending = [(level, position, piece)]
+
+		while(pending):
+			level, position, piece = pending.pop()
+
+			if(level == self.windowLevel):
+				window ^= bytesToNumber(piece) << (8*position)
+				continue
+
+			half = self.levels[level][1]
+			while(piece):
+				start = position % half
+				n = min(len(piece), half - start)
+				pending.append((level + 1, start, piece[:n]))
+				piece = piece[n:]
+				position += n
+
+		return window
+
+	# Returns the 16 byte hash of the message
+	def digest(self):
+		if(self.size is None):
+			hashObject = Hash(self.count)
+			for piece in self.data:
+				hashObject.update(piece)
+			return hashObject.digest()
+
+		if(self.count != self.size):
+			raise ValueError("the message is shorter than its size")
+
+		# The padding added by every level above the window
+		window = self.window
+		for level in range(self.windowLevel):
+			levelSize, half = self.levels[level]
+			window = self.fold(window, level, levelSize, hashPadding(2*half - levelSize))
+
+		return foldMessage(numberToBytes(window, self.windowSize))
+
+	# Returns an independent copy of the hash object
+	def copy(self):
+		hashObject = Hash.__new__(Hash)
+		hashObject.__dict__.update(self.__dict__)
+
+		if(self.size is None):
+			hashObject.data = list(self.data)
+
+		return hashObject
+
+# Hash the first `size` bytes of `data`, with the same result as hash(). `data` can be a string or a memory-mapped file
+# The data is read in pieces of chunkSize bytes
+def hashBuffer(data, size=None):
+	if(size is None):
+		size = len(data)
+
+	hashObject = Hash(size)
+	for start in range(0, size, chunkSize):
+		hashObject.update(data[start : min(start + chunkSize, size)])
+
+	return hashObject.digest()
+
+# Hash the rest of an open file, read in pieces of chunkSize bytes
+def hashFile(file, size=None):
+	if(size is None):
+		size = os.fstat(file.fileno()).st_size - file.tell()
+
+	hashObject = Hash(size)
+	while(True):
+		piece = file.read(min(chunkSize, size - hashObject.count))
+		if(not piece):
+			break
+		hashObject.update(piece)
+
+	return hashObject.digest()
+
+# Hashes one segment of a file for hashFileParallel, in a worker process
+# task - (filename, size, start, length) where size is the size of the whole message
+# Returns the window and the byte count of the segment
+def hashSegment(task):
+	filename, size, start, length = task
+	file = open(filename, "rb")
+	mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	try:
+		hashObject = Hash(size, start)
+		for position in range(start, start + length, chunkSize):
+			hashObject.update(mapped[position : min(position + chunkSize, start + length)])
+	finally:
+		mapped.close()
+		file.close()
+
+	return hashObject.window, hashObject.count
+
+# Hash the first `size` bytes of a file, with the same result as hash()
+# The hash is a XOR of the folded bytes, so segments of segmentSize bytes are folded by `jobs` processes and their windows are XORed together
+def hashFileParallel(filename, size=None, jobs=None, segmentSize=1 << 26):
+	if(size is None):
+		size = os.path.getsize(filename)
+
+	hashObject = Hash(size)
+	tasks = [(filename, size, start, min(segmentSize, size - start)) for start in range(0, size, segmentSize)]
+
+	if(len(tasks) <= 1):
+		results = map(hashSegment, tasks)
+	else:
+		pool = multiprocessing.Pool(jobs)
+		try:
+			results = pool.map(hashSegment, tasks)
+		finally:
+			pool.close()
+			pool.join()
+
+	for window, count in results:
+		segment = Hash.__new__(Hash)
+		segment.window = window
+		segment.count = count
+		hashObject.combine(segment)
+
+	return hashObject.digest()
+
 # Convert a list to string
 def listToString(lst):
-	# Initialize an empty string
-	str1 = ""
-	# Traverse in the string
-	for elem in lst:
-		str1 += elem
-
-	# Return string
-	return str1
+	return "".join(lst)
 
-# Hash clear text, then encrypt it.
+# Hash clear text, then encrypt it. `cleartext` can also be an open file, hashed as it is read
 def hash_and_encrypt(cleartext, key):
-	hashvalue = hash(cleartext)
+	if(hasattr(cleartext, "read")):
+		hashvalue = hashFile(cleartext)
+	else:
+		hashvalue = hash(cleartext)
+
+	return encrypt_hash(hashvalue, key)
+
+# Encrypt a hash value
+def encrypt_hash(hashvalue, key):
 	print "Ozet Degeri:", [ord(x) for x in hashvalue], "\n"
 
 	print "Anahtar:", [ord(x) for x in key], "\n"
@@ -102,7 +324,368 @@ def partD(file, key):
 		print "\n*** Dosya butunlugunun korunmadigi tespit edilmistir. Dosyada bir degisiklik meydana gelmistir. "
 
 
+# Part C over a memory-mapped file. The hash is computed over the mapped region
+# and the encrypted hash is appended to a copy of the file, the file is never read into a string
+# jobs - number of processes hashing the file, the hash is computed in this process when it is 1
+def partCMapped(filename, key, jobs=1):
+	print "---------- PART C: Ozet Alma / Sifreleme ve Dosyanin Sonuna Ekleme (mmap) ----------\n"
+	if(jobs != 1):
+		hashvalue = hashFileParallel(filename, jobs=jobs)
+	else:
+		file = open(filename, "rb")
+		mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			hashvalue = hashBuffer(mapped)
+		finally:
+			mapped.close()
+			file.close()
+
+	cipher = encrypt_hash(hashvalue, key)
+
+	encryptFilename = "hash_encrypt_" + filename
+	shutil.copyfile(filename, encryptFilename)
+	encryptFile = open(encryptFilename, "ab")
+	encryptFile.write(cipher)
+	encryptFile.close()
+
+	print encryptFilename + " isimli dosya olusturuldu. Son durumu bu dosya icerir"
+
+	return encryptFilename
+
+# Part D over a memory-mapped file. The body is hashed over the mapped region and the encrypted hash is read by seeking to the end
+# jobs - number of processes hashing the file, the hash is computed in this process when it is 1
+def partDMapped(encryptFilename, key, jobs=1):
+	print "\n---------- PART D: Dosyanin Butunlugunu Dogrulama (mmap) ----------\n"
+	decryptFile = open(encryptFilename, "rb")
+	if(jobs != 1):
+		hashvalue = hashFileParallel(encryptFilename, os.path.getsize(encryptFilename) - trailerSize, jobs)
+	else:
+		mapped = mmap.mmap(decryptFile.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			hashvalue = hashBuffer(mapped, len(mapped) - trailerSize)
+		finally:
+			mapped.close()
+
+	decryptFile.seek(-trailerSize, 2)
+	ency_hash = decryptFile.read(trailerSize)
+	decryptFile.close()
+
+	print "Gelen Acik Metnin Ozet Degeri:", [ord(x) for x in hashvalue], "\n"
+
+	decr = aesmodule.decryptMessage(key, ency_hash, mode)
+	print 'Gelen Sifrelenmis Ozet Degerin Desifrelenmesi (Cozumlenen Ozet Deger):', [ord(x) for x in decr], "\n"
+
+	if(hashvalue == decr):
+		print "\n*** Dosya butunlugunun korundugu teyit edilmistir."
+		return True
+
+	print "\n*** Dosya butunlugunun korunmadigi tespit edilmistir. Dosyada bir degisiklik meydana gelmistir. "
+	return False
+
+# Part C and the encryption of the file in one pass: the file is encrypted in GCM mode, whose tag authenticates it
+# The file is read once and the sealed file written once
+def partCSealed(filename, key):
+	print "---------- PART C: Sifreleme ve Dogrulama Etiketi (GCM) ----------\n"
+	sealedFilename = "sealed_" + filename
+	aesmodule.encryptFile(key, filename, sealedFilename, aesmodule.AES.modes["GCM"])
+
+	print sealedFilename + " isimli dosya olusturuldu. Sifreli metni ve dogrulama etiketini icerir"
+
+	return sealedFilename
+
+# Part D of a sealed file: the file is decrypted and its tag checked in one pass
+# Returns True and writes the clear text to outFilename when the file is intact
+def partDSealed(sealedFilename, key, outFilename):
+	print "\n---------- PART D: Dosyanin Butunlugunu Dogrulama (GCM) ----------\n"
+	try:
+		aesmodule.decryptFile(key, sealedFilename, outFilename, aesmodule.AES.modes["GCM"])
+	except ValueError:
+		print "\n*** Dosya butunlugunun korunmadigi tespit edilmistir. Dosyada bir degisiklik meydana gelmistir. "
+		return False
+
+	print "\n*** Dosya butunlugunun korundugu teyit edilmistir."
+	return True
+
+# Verifies one file for verifyFiles, in a worker process, without printing
+# task - (filename, key)
+# Returns the filename and its manifest entry: status ("ok", "corrupt" or "error"), size, mtime and seconds
+def verifyFile(task):
+	filename, key = task
+	start = time.time()
+	entry = dict(status="error", size=None, mtime=None)
+
+	try:
+		stat = os.stat(filename)
+		entry["size"] = stat.st_size
+		entry["mtime"] = stat.st_mtime
+
+		file = open(filename, "rb")
+		try:
+			mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				hashvalue = hashBuffer(mapped, len(mapped) - trailerSize)
+				ency_hash = mapped[-trailerSize:]
+			finally:
+				mapped.close()
+		finally:
+			file.close()
+
+		decr = aesmodule.decryptMessage(key, ency_hash, mode)
+		entry["status"] = "ok" if hashvalue == decr else "corrupt"
+	except (IOError, OSError, ValueError) as error:
+		entry["error"] = str(error)
+
+	entry["seconds"] = time.time() - start
+
+	return filename, entry
+
+# Returns the files under `paths`. Directories are walked and only their files starting with `prefix` are taken,
+# the files given directly are always taken
+def integrityFiles(paths, prefix="hash_encrypt_"):
+	filenames = []
+
+	for path in paths:
+		if(not os.path.isdir(path)):
+			filenames.append(path)
+			continue
+
+		for directory, subdirectories, names in os.walk(path):
+			subdirectories.sort()
+			for name in sorted(names):
+				if(name.startswith(prefix)):
+					filenames.append(os.path.join(directory, name))
+
+	return filenames
+
+# Verifies the encrypted hash at the end of every file, in `jobs` processes
+# manifest - JSON file of the results. A file with the same size and mtime as in the manifest is not verified again, unless `force`
+# Returns the manifest as a dictionary of filename to entry, the entries of skipped files have "skipped" set
+def verifyFiles(filenames, key, jobs=None, manifest=None, force=False):
+	previous = {}
+	if(manifest is not None and not force and os.path.exists(manifest)):
+		with open(manifest) as file:
+			previous = json.load(file)["files"]
+
+	results = {}
+	tasks = []
+	for filename in filenames:
+		old = previous.get(filename)
+		try:
+			stat = os.stat(filename)
+		except OSError:
+			stat = None
+
+		if(old is not None and stat is not None and old["status"] != "error" and
+		   old["size"] == stat.st_size and old["mtime"] == stat.st_mtime):
+			results[filename] = dict(old, skipped=True, seconds=0.0)
+		else:
+			tasks.append((filename, key))
+
+	if(len(tasks) <= 1):
+		verified = map(verifyFile, tasks)
+	else:
+		pool = multiprocessing.Pool(jobs)
+		try:
+			verified = list(pool.imap_unordered(verifyFile, tasks))
+		finally:
+			pool.close()
+			pool.join()
+
+	for filename, entry in verified:
+		results[filename] = entry
+
+	if(manifest is not None):
+		# The manifest is replaced at once, an interrupted run leaves the previous one
+		temporary = manifest + ".tmp"
+		with open(temporary, "w") as file:
+			json.dump(dict(created=time.time(), files=results), file, indent=2, sort_keys=True)
+		os.rename(temporary, manifest)
+
+	return results
+
+# Hash of one chunk of a chunked integrity record. The chunk is hashed after its position and length,
+# so a moved chunk does not match and a chunk shorter than 16 bytes can be hashed
+def chunkHash(data, start):
+	hashObject = Hash(16 + len(data))
+	hashObject.update(struct.pack(">QQ", start, len(data)))
+	for position in range(0, len(data), chunkSize):
+		hashObject.update(data[position : position + chunkSize])
+
+	return hashObject.digest()
+
+# Root of a chunked integrity record: the hash of the chunk hashes, after the chunk size and the file size
+def chunkRoot(recordChunkSize, size, hashes):
+	return hash(struct.pack(">QQ", recordChunkSize, size) + "".join(hashes))
+
+# Hashes some chunks of a file for hashChunks, in a worker process
+# task - (filename, recordChunkSize, size, indexes)
+# Returns a list of (index, hash)
+def hashChunkTask(task):
+	filename, recordChunkSize, size, indexes = task
+	file = open(filename, "rb")
+	mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else ""
+
+	try:
+		return [(index, chunkHash(mapped[index*recordChunkSize : min((index+1)*recordChunkSize, size)], index*recordChunkSize))
+				for index in indexes]
+	finally:
+		if(size):
+			mapped.close()
+		file.close()
+
+# Returns a dictionary of chunk index to hash for the chunks `indexes` of the first `size` bytes of a file
+# The chunks are shared between `jobs` processes
+def hashChunks(filename, recordChunkSize, size, indexes, jobs=1):
+	indexes = sorted(indexes)
+
+	if(jobs == 1 or len(indexes) <= 1):
+		return dict(hashChunkTask((filename, recordChunkSize, size, indexes)))
+
+	if(jobs is None):
+		jobs = multiprocessing.cpu_count()
+	tasks = [(filename, recordChunkSize, size, indexes[i::jobs]) for i in range(jobs) if indexes[i::jobs]]
+
+	pool = multiprocessing.Pool(jobs)
+	try:
+		results = pool.map(hashChunkTask, tasks)
+	finally:
+		pool.close()
+		pool.join()
+
+	return dict(pair for result in results for pair in result)
+
+# Reads a chunked integrity record
+# Returns (recordChunkSize, size, hashes, ency_root)
+def readChunkRecord(recordFilename):
+	with open(recordFilename, "rb") as file:
+		content = file.read()
+
+	if(content[:4] != recordMagic or len(content) < 16 + trailerSize):
+		raise ValueError(recordFilename + " is not a chunk record")
+
+	recordChunkSize, size = struct.unpack(">IQ", content[4:16])
+	hashes = content[16:-trailerSize]
+	if(len(hashes) != 16 * ((size + recordChunkSize - 1) // recordChunkSize)):
+		raise ValueError(recordFilename + " is not a chunk record")
+
+	return recordChunkSize, size, [hashes[i:i+16] for i in range(0, len(hashes), 16)], content[-trailerSize:]
+
+# Returns the hashes of a record whose root is the decrypted one, None when the record does not match the key
+def checkedChunkRecord(recordFilename, key):
+	recordChunkSize, size, hashes, ency_root = readChunkRecord(recordFilename)
+
+	if(aesmodule.decryptMessage(key, ency_root, mode) != chunkRoot(recordChunkSize, size, hashes)):
+		return None
+
+	return recordChunkSize, size, hashes
+
+# Part C with a chunked integrity record. The hash of every chunk of `recordChunkSize` bytes and the encrypted root over them
+# are written to filename + recordSuffix, the file itself is not changed
+# When the record already exists, only the chunks after its end and the chunks touching the `changed` byte ranges are hashed again,
+# so sealing a file that grew by appends costs the size of the appended data
+# Returns the record filename and the indexes of the chunks hashed
+def sealChunked(filename, key, recordChunkSize=1 << 20, changed=(), jobs=1):
+	recordFilename = filename + recordSuffix
+	size = os.path.getsize(filename)
+	count = (size + recordChunkSize - 1) // recordChunkSize
+
+	old = None
+	if(os.path.exists(recordFilename)):
+		old = checkedChunkRecord(recordFilename, key)
+
+	hashes = [None] * count
+	if(old is not None and old[0] == recordChunkSize):
+		# Chunks complete in both the previous and the new size are kept, a partial last chunk has grown or been cut
+		oldSize, oldHashes = old[1], old[2]
+		for index in range(min(size, oldSize) // recordChunkSize):
+			hashes[index] = oldHashes[index]
+
+		for start, end in changed:
+			for index in range(start // recordChunkSize, min(count, (end + recordChunkSize - 1) // recordChunkSize)):
+				hashes[index] = None
+
+	indexes = [index for index in range(count) if hashes[index] is None]
+	for index, chunk in hashChunks(filename, recordChunkSize, size, indexes, jobs).items():
+		hashes[index] = chunk
+
+	ency_root = aesmodule.encryptMessage(key, chunkRoot(recordChunkSize, size, hashes), mode)
+
+	# The record is replaced at once, an interrupted seal leaves the previous one
+	temporary = recordFilename + ".tmp"
+	with open(temporary, "wb") as file:
+		file.write(recordMagic + struct.pack(">IQ", recordChunkSize, size) + "".join(hashes) + ency_root)
+	os.rename(temporary, recordFilename)
+
+	return recordFilename, indexes
+
+# Part D with a chunked integrity record
+# ranges - only the chunks touching these byte ranges are hashed, all chunks when it is None
+# Returns the corrupted byte ranges, an empty list when the file is intact. A file that grew or shrank is corrupted after the shorter size
+# Raises ValueError when the record itself does not match the key
+def verifyChunked(filename, key, ranges=None, jobs=1):
+	record = checkedChunkRecord(filename + recordSuffix, key)
+	if(record is None):
+		raise ValueError("the chunk record of " + filename + " is corrupted or made with another key")
+
+	recordChunkSize, recordSize, hashes = record
+	size = os.path.getsize(filename)
+	common = min(size, recordSize)
+	count = (common + recordChunkSize - 1) // recordChunkSize
+
+	if(ranges is None):
+		indexes = range(count)
+	else:
+		indexes = set()
+		for start, end in ranges:
+			indexes.update(range(start // recordChunkSize, min(count, (end + recordChunkSize - 1) // recordChunkSize)))
+
+	# A chunk cut by a shorter size does not match, its length is part of its hash
+	corrupted = []
+	for index, chunk in sorted(hashChunks(filename, recordChunkSize, common, indexes, jobs).items()):
+		start = index * recordChunkSize
+		end = min(start + recordChunkSize, common)
+		if(chunk != hashes[index]):
+			if(corrupted and corrupted[-1][1] == start):
+				corrupted[-1] = (corrupted[-1][0], end)
+			else:
+				corrupted.append((start, end))
+
+	if(size != recordSize):
+		if(corrupted and corrupted[-1][1] == common):
+			corrupted[-1] = (corrupted[-1][0], max(size, recordSize))
+		else:
+			corrupted.append((common, max(size, recordSize)))
+
+	return corrupted
+
 if __name__ == "__main__":
+	# Bulk verification: python part_c_d.py --verify keyfile manifest.json directory|file|@filelist ...
+	if(len(sys.argv) > 1 and sys.argv[1] == "--verify"):
+		if(len(sys.argv) < 5):
+			print "Run like that: python part_c_d.py --verify keyfile manifest.json directory|file|@filelist ...\n"
+			exit()
+
+		key = open(sys.argv[2], "rb").read()
+		paths = []
+		for path in sys.argv[4:]:
+			if(path.startswith("@")):
+				paths += [line.strip() for line in open(path[1:]) if line.strip()]
+			else:
+				paths.append(path)
+
+		results = verifyFiles(integrityFiles(paths), key, manifest=sys.argv[3])
+
+		failed = 0
+		for filename in sorted(results):
+			entry = results[filename]
+			status = entry["status"] + (" (skipped)" if entry.get("skipped") else "")
+			print "%-20s %8.3f s  %s" % (status, entry["seconds"], filename)
+			if(entry["status"] != "ok"):
+				failed += 1
+
+		print "\n%d files, %d failed" % (len(results), failed)
+		sys.exit(1 if failed else 0)
+
 	if(len(sys.argv) != 2):
 		print "Please give input file as argument.\nRun typle like that: python part_c_d.py inputfile.txt\n"
 		exit()
@@ -127,4 +710,17 @@ if __name__ == "__main__":
 	wrong = open(encryptFilename, "r+")
 	wrong.write("change file content ")
 	wrong.close()
-	partD(encryptFilename, key)
\ No newline at end of file
+	partD(encryptFilename, key)
+
+	print "\n\n--------------------- TEST 3: BELLEGE ESLENMIS DOSYA (MMAP) ---------------------"
+	encryptFilename = partCMapped(filename, key)
+	partDMapped(encryptFilename, key)
+
+	print "\n\n--------------------- TEST 4: PARCALI BUTUNLUK KAYDI ---------------------"
+	recordFilename, indexes = sealChunked(filename, key)
+	print recordFilename + " isimli kayit olusturuldu,", len(indexes), "parca ozetlendi."
+	print "Bozulan araliklar:", verifyChunked(filename, key)
+
+	print "\n\n--------------------- TEST 5: TEK GECISTE SIFRELEME VE DOGRULAMA (GCM) ---------------------"
+	sealedFilename = partCSealed(filename, key)
+	partDSealed(sealedFilename, key, "opened_" + filename)
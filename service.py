@@ -0,0 +1,358 @@
+#! /usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Non-blocking front-end for encryptMessage, decryptMessage and hash_and_encrypt
+# The CPU work runs in a thread or process pool. Every request is split in pieces and the pieces of all requests are
+# given to the pool in turn, so a huge request cannot keep the workers away from the small ones
+
+import part_a_b as aesmodule
+import part_c_d as hashmodule
+import collections
+import functools
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+import Queue
+
+# Runs one task in a worker and returns (True, result) or (False, error)
+# task - (function, argument)
+def runTask(task):
+	function, argument = task
+	try:
+		return True, function(argument)
+	except Exception as error:
+		return False, error
+
+# XOR a piece of a CTR message with its keystream
+# argument - (key, IVector, startBlock, data)
+def counterPiece(argument):
+	key, IVector, startBlock, data = argument
+	keystream = aesmodule.AES().counterKeystream(key, IVector, startBlock, (len(data) + 15) // 16)
+
+	return aesmodule.xorBytes(data, keystream)
+
+# Encrypts a piece of a CFB, CBC or OFB message, or decrypts a piece of an OFB message
+# argument - (key, mode, feedback, data) where feedback is the chaining block left by the previous piece
+# Returns the output of the piece and the chaining block for the next one
+def chainPiece(argument):
+	key, mode, feedback, data = argument
+	encryptor = aesmodule.MessageEncryptor(key, mode, feedback)
+	encryptor.header = b""
+
+	out = encryptor.update(data)
+	if(len(encryptor.buffer)):
+		out += encryptor.finalizePartial()
+
+	return out, bytes(encryptor.feedback)
+
+# Encrypts or decrypts a whole GCM message. The tag covers the whole message, so it is not split
+# argument - (key, data, isInv)
+def gcmPiece(argument):
+	key, data, isInv = argument
+
+	if(isInv == True):
+		return aesmodule.decryptMessage(key, data, aesmodule.AES.modes["GCM"])
+
+	return aesmodule.encryptMessage(key, data, aesmodule.AES.modes["GCM"])
+
+# Hashes a piece of a message
+# argument - (size, start, data) where size is the size of the whole message
+# Returns the window and the byte count of the piece, to be combined by a Hash of the same size
+def hashPiece(argument):
+	size, start, data = argument
+	hashObject = hashmodule.Hash(size, start)
+	hashObject.update(data)
+
+	return hashObject.window, hashObject.count
+
+# The final value of a job generator
+class JobResult(object):
+
+	def __init__(self, value):
+		self.value = value
+
+# Job of encryptMessage. A job is a generator: it yields a list of tasks that can run at the same time, receives the list of their results,
+# and finally yields a JobResult
+def encryptMessageJob(key, input, mode, pieceSize):
+	key = aesmodule.getExpandedKey(key).key
+	data = memoryview(aesmodule.asBuffer(input)).tobytes()
+
+	if(mode == aesmodule.AES.modes["GCM"]):
+		[cipher] = yield [(gcmPiece, (key, data, False))]
+		yield JobResult(cipher)
+		return
+
+	# Create a new IVector using random input
+	IVector = os.urandom(16)
+
+	if(mode == aesmodule.AES.modes["CTR"]):
+		results = yield [(counterPiece, (key, IVector, start // 16, data[start : start+pieceSize]))
+						 for start in range(0, len(data), pieceSize)]
+		yield JobResult(IVector + b"".join(results))
+		return
+
+	# Return s padded to a multiple of 16-bytes by PKCS7 padding
+	if(mode == aesmodule.AES.modes["CBC"]):
+		numpads = 16 - (len(data) % 16)
+		data += numpads * chr(numpads)
+
+	# The pieces chain, each one waits for the previous one
+	feedback = IVector
+	out = []
+	for start in range(0, len(data), pieceSize):
+		[(piece, feedback)] = yield [(chainPiece, (key, mode, feedback, data[start : start+pieceSize]))]
+		out.append(piece)
+
+	yield JobResult(IVector + b"".join(out))
+
+# Job of decryptMessage
+def decryptMessageJob(key, input, mode, pieceSize):
+	key = aesmodule.getExpandedKey(key).key
+	data = memoryview(aesmodule.asBuffer(input)).tobytes()
+
+	if(mode == aesmodule.AES.modes["GCM"]):
+		[decr] = yield [(gcmPiece, (key, data, True))]
+		yield JobResult(decr)
+		return
+
+	IVector = data[:16]
+	data = data[16:]
+
+	if(mode == aesmodule.AES.modes["CTR"]):
+		results = yield [(counterPiece, (key, IVector, start // 16, data[start : start+pieceSize]))
+						 for start in range(0, len(data), pieceSize)]
+
+	elif(mode in (aesmodule.AES.modes["CBC"], aesmodule.AES.modes["CFB"])):
+		# Every cipher block is known, so the pieces only need the cipher block before them
+		tasks = []
+		for start in range(0, len(data), pieceSize):
+			previous = IVector if start == 0 else data[start-16 : start]
+			tasks.append((aesmodule.decryptChunk, (key, mode, previous, data[start : start+pieceSize])))
+		results = yield tasks
+
+	else:
+		feedback = IVector
+		results = []
+		for start in range(0, len(data), pieceSize):
+			[(piece, feedback)] = yield [(chainPiece, (key, mode, feedback, data[start : start+pieceSize]))]
+			results.append(piece)
+
+	decr = b"".join(results)
+
+	# Return s stripped of PKCS7 padding
+	if(mode == aesmodule.AES.modes["CBC"]):
+		decr = decr[ : -ord(decr[-1])]
+
+	yield JobResult(decr)
+
+# Job of hash_and_encrypt, without its prints
+def hashAndEncryptJob(cleartext, key, pieceSize):
+	data = memoryview(aesmodule.asBuffer(cleartext)).tobytes()
+	size = len(data)
+
+	hashObject = hashmodule.Hash(size)
+	results = yield [(hashPiece, (size, start, data[start : start+pieceSize])) for start in range(0, size, pieceSize)]
+
+	for window, count in results:
+		segment = hashmodule.Hash.__new__(hashmodule.Hash)
+		segment.window = window
+		segment.count = count
+		hashObject.combine(segment)
+
+	yield JobResult(aesmodule.encryptMessage(key, hashObject.digest(), hashmodule.mode))
+
+# A request running in a CryptoService
+class Job(object):
+
+	def __init__(self, service, generator):
+		self.service = service
+		self.generator = generator
+		# Tasks of the current step not given to the pool yet, as (index, task)
+		self.waiting = collections.deque()
+		self.results = []
+		self.remaining = 0
+		self.value = None
+		self.error = None
+		self.finished = threading.Event()
+		self.callbacks = []
+		# Guards callbacks and finished, so a callback added while the job finishes runs once
+		self.callbackLock = threading.Lock()
+
+	# Sends the results of a step to the generator and queues the tasks of the next step
+	def advance(self, results):
+		try:
+			if(results is None):
+				step = next(self.generator)
+			else:
+				step = self.generator.send(results)
+		except Exception as error:
+			self.finish(None, error)
+			return
+
+		if(isinstance(step, JobResult)):
+			self.finish(step.value, None)
+			return
+
+		if(len(step) == 0):
+			self.advance([])
+			return
+
+		self.results = [None] * len(step)
+		self.remaining = len(step)
+		self.waiting = collections.deque(enumerate(step))
+		self.service.queue(self)
+
+	def finish(self, value, error):
+		self.value = value
+		self.error = error
+		self.generator.close()
+		with self.callbackLock:
+			self.finished.set()
+			callbacks = list(self.callbacks)
+			del self.callbacks[:]
+		self.service.jobDone(self)
+
+		for callback in callbacks:
+			callback(self)
+
+	def done(self):
+		return self.finished.is_set()
+
+	# Waits for the job and returns its value, or raises its error
+	def result(self, timeout=None):
+		if(not self.finished.wait(timeout)):
+			raise RuntimeError("the job is not finished")
+
+		if(self.error is not None):
+			raise self.error
+
+		return self.value
+
+	# Calls callback(job) when the job is finished, in the thread that finishes it
+	def addDoneCallback(self, callback):
+		with self.callbackLock:
+			# The job may have finished before the callback was added
+			if(not self.done()):
+				self.callbacks.append(callback)
+				return
+
+		callback(self)
+
+	# Returns a future of `loop` that gets the value or the error of the job
+	# `loop` is an event loop with create_future() and call_soon_threadsafe(), like an asyncio loop, so the job can be awaited
+	def loopFuture(self, loop):
+		future = loop.create_future()
+
+		def resolve(job):
+			if(future.cancelled()):
+				return
+			if(job.error is not None):
+				future.set_exception(job.error)
+			else:
+				future.set_result(job.value)
+
+		self.addDoneCallback(lambda job: loop.call_soon_threadsafe(resolve, job))
+
+		return future
+
+# Runs encryption, decryption and integrity requests in a pool without blocking the caller
+# workers - number of threads or processes
+# executor - "thread" or "process"
+# maxJobs - the most requests in flight, submitting more waits until one finishes
+# pieceSize - size of the pieces the payloads are split into
+class CryptoService(object):
+
+	def __init__(self, workers=None, executor="thread", maxJobs=64, pieceSize=1 << 18):
+		if(workers is None):
+			workers = multiprocessing.cpu_count()
+
+		if(executor == "process"):
+			self.pool = multiprocessing.Pool(workers)
+		elif(executor == "thread"):
+			self.pool = multiprocessing.pool.ThreadPool(workers)
+		else:
+			raise ValueError("executor must be thread or process")
+
+		self.workers = workers
+		self.pieceSize = max(16, pieceSize // 16 * 16)
+		self.slots = threading.BoundedSemaphore(maxJobs)
+		self.lock = threading.Lock()
+		# Jobs with tasks waiting for the pool, served in turn
+		self.ready = collections.deque()
+		# Number of tasks in the pool
+		self.running = 0
+
+	# Encrypt `input` like encryptMessage, returns a Job
+	# block - wait for a free slot when maxJobs requests are in flight, otherwise raise Queue.Full
+	def encryptMessage(self, key, input, mode, block=True):
+		return self.submit(encryptMessageJob(key, input, mode, self.pieceSize), block)
+
+	# Decrypt `input` like decryptMessage, returns a Job
+	def decryptMessage(self, key, input, mode, block=True):
+		return self.submit(decryptMessageJob(key, input, mode, self.pieceSize), block)
+
+	# Hash `cleartext` and encrypt the hash like hash_and_encrypt, returns a Job
+	def hashAndEncrypt(self, cleartext, key, block=True):
+		return self.submit(hashAndEncryptJob(cleartext, key, self.pieceSize), block)
+
+	def submit(self, generator, block):
+		if(not self.slots.acquire(block)):
+			raise Queue.Full("too many requests in flight")
+
+		job = Job(self, generator)
+		job.advance(None)
+		self.dispatch()
+
+		return job
+
+	# Adds a job with waiting tasks to the turn
+	def queue(self, job):
+		with self.lock:
+			self.ready.append(job)
+
+	def jobDone(self, job):
+		self.slots.release()
+
+	# Gives tasks to the pool while a worker is free, one task of each ready job in turn
+	def dispatch(self):
+		with self.lock:
+			while(self.running < self.workers and self.ready):
+				job = self.ready.popleft()
+				index, task = job.waiting.popleft()
+				if(job.waiting):
+					self.ready.append(job)
+
+				self.running += 1
+				self.pool.apply_async(runTask, (task,), callback=functools.partial(self.taskDone, job, index))
+
+	# Called by the pool with the outcome of a task
+	def taskDone(self, job, index, outcome):
+		ok, result = outcome
+
+		with self.lock:
+			self.running -= 1
+			if(job.done()):
+				stepDone = False
+			elif(not ok):
+				# The other tasks of the job are dropped
+				if(job in self.ready):
+					self.ready.remove(job)
+				job.waiting.clear()
+				stepDone = False
+			else:
+				job.results[index] = result
+				job.remaining -= 1
+				stepDone = (job.remaining == 0)
+
+		if(not ok and not job.done()):
+			job.finish(None, result)
+		elif(stepDone):
+			job.advance(job.results)
+
+		self.dispatch()
+
+	# Stops the pool after the running tasks
+	def close(self):
+		self.pool.close()
+		self.pool.join()